@@ -6,10 +6,13 @@ Aplicación Streamlit para buscar estudiantes y generar certificados de matrícu
 """
 
 import streamlit as st
-import pandas as pd
 from datetime import datetime
-from utils import formatear_run, limpiar_run, validar_run, formatear_curso
-from generador_certificado import GeneradorCertificado
+from utils import formatear_run, limpiar_run, validar_run, formatear_curso, interpretar_run
+from generador_certificado import GeneradorCertificado, calcular_etag
+from registro_templates import RegistroTemplates
+from base_datos import BaseDatosPorAnio, preparar_particiones
+from prerender import AlmacenCertificados
+from perfilador import perfilado
 
 # Configuración de la página
 st.set_page_config(
@@ -67,63 +70,120 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-@st.cache_data
+@st.cache_resource
 def cargar_datos():
-    """Carga los datos de prematrícula desde el archivo Excel"""
-    df = pd.read_excel('datos_prematricula.xlsx')
-    return df
+    """
+    Prepara la base de datos de prematrícula particionada por año escolar
+
+    Las particiones se regeneran desde el Excel solo si este cambió.
+    Cada año se carga en memoria recién cuando se consulta.
+    """
+    preparar_particiones('datos_prematricula.xlsx', 'datos_por_anio')
+    return BaseDatosPorAnio('datos_por_anio')
+
+
+@st.cache_resource
+def obtener_registro_templates():
+    """Registro de templates compartido por todas las sesiones"""
+    return RegistroTemplates('templates', 'template_certificado.docx')
 
 
-def buscar_estudiante(df, run):
+@st.cache_resource
+def obtener_almacen_certificados():
+    """Almacén de certificados pre-generados (ver prerender.py)"""
+    return AlmacenCertificados('certificados_prerender')
+
+
+def _buscar_por_run(df, run, anio=None):
     """
-    Busca un estudiante en la base de datos por RUN
-    VERSIÓN MEJORADA - Maneja RUNs con o sin DV correctamente
+    Busca un RUN (sin DV) exacto
+
+    Args:
+        df (BaseDatosPorAnio o DataFrame): Base de datos de estudiantes
+        run (int): RUN sin dígito verificador
+        anio (int, optional): Año escolar. Por defecto el más reciente.
+
+    Returns:
+        Series o None: Fila del estudiante si se encuentra
+    """
+    if isinstance(df, BaseDatosPorAnio):
+        return df.buscar(run, anio)
+
+    if anio is None:
+        anio = df['ANO_ESCOLAR'].max()
+    filtro = (df['SAL_RUN'] == run) & (df['ANO_ESCOLAR'] == anio)
+    resultado = df[filtro]
+    if len(resultado) > 0:
+        return resultado.iloc[0]
+    return None
+
+
+@perfilado('buscar_estudiante')
+def buscar_estudiante_detallado(df, run, anio=None):
+    """
+    Busca un estudiante por RUN usando el dígito verificador para decidir
+    cómo interpretar el ingreso (ver utils.interpretar_run)
+    
+    Normalmente se hace una sola consulta al índice. Solo cuando el ingreso
+    es solo números, de hasta 8 dígitos, y su último dígito es un DV válido
+    se consultan las dos interpretaciones, para detectar si ambas
+    corresponden a estudiantes. Con 9 dígitos, el RUN provisorio (ingreso
+    completo sin DV) se consulta primero si el último dígito no es un DV
+    válido, y si lo es, solo cuando la interpretación con DV no existe.
     
     Args:
-        df (DataFrame): Base de datos de estudiantes
+        df (BaseDatosPorAnio o DataFrame): Base de datos de estudiantes
         run (str o int): RUN del estudiante (puede incluir puntos y guión)
+        anio (int, optional): Año escolar. Por defecto el más reciente.
         
     Returns:
-        DataFrame o None: Fila del estudiante si se encuentra, None en caso contrario
+        dict: {'estudiante': Series o None,
+               'coincidencias': list de Series (más de una si es ambiguo),
+               'ambiguo': bool,
+               'consultas': int (consultas al índice realizadas)}
     """
-    # Limpiar el RUN ingresado
-    run_limpio = limpiar_run(str(run))
-    
-    if not run_limpio or len(run_limpio) < 2:
-        return None
+    principales, alternativas = interpretar_run(run)
+    coincidencias = []
+    consultas = 0
     
-    # Estrategia 1: Intentar buscar el RUN completo tal cual
-    # (usuario puede haber ingresado solo números sin DV)
-    try:
-        run_completo = int(run_limpio)
-        resultado = df[df['SAL_RUN'] == run_completo]
-        if len(resultado) > 0:
-            return resultado.iloc[0]
-    except:
-        pass
+    for run_sin_dv in principales:
+        consultas += 1
+        estudiante = _buscar_por_run(df, run_sin_dv, anio)
+        if estudiante is not None:
+            coincidencias.append(estudiante)
     
-    # Estrategia 2: Asumir que el último dígito es el DV
-    # (usuario ingresó RUN con DV)
-    try:
-        run_sin_dv = int(run_limpio[:-1])
-        resultado = df[df['SAL_RUN'] == run_sin_dv]
-        if len(resultado) > 0:
-            return resultado.iloc[0]
-    except:
-        pass
+    # Solo si no hubo coincidencias: DV mal digitado o formato antiguo
+    if not coincidencias:
+        for run_sin_dv in alternativas:
+            consultas += 1
+            estudiante = _buscar_por_run(df, run_sin_dv, anio)
+            if estudiante is not None:
+                coincidencias.append(estudiante)
+                break
     
-    # Estrategia 3: Si tiene más de 8 dígitos, probar quitando 2 últimos
-    # (por si acaso tiene formato raro)
-    if len(run_limpio) > 8:
-        try:
-            run_sin_2digitos = int(run_limpio[:-2])
-            resultado = df[df['SAL_RUN'] == run_sin_2digitos]
-            if len(resultado) > 0:
-                return resultado.iloc[0]
-        except:
-            pass
+    return {
+        'estudiante': coincidencias[0] if coincidencias else None,
+        'coincidencias': coincidencias,
+        'ambiguo': len(coincidencias) > 1,
+        'consultas': consultas,
+    }
+
+
+def buscar_estudiante(df, run, anio=None):
+    """
+    Busca un estudiante en la base de datos por RUN
+    Maneja RUNs con o sin DV, priorizando la interpretación con DV válido
     
-    return None
+    Args:
+        df (BaseDatosPorAnio o DataFrame): Base de datos de estudiantes
+        run (str o int): RUN del estudiante (puede incluir puntos y guión)
+        anio (int, optional): Año escolar. Por defecto el más reciente
+            (con BaseDatosPorAnio solo se consulta la partición de ese año).
+        
+    Returns:
+        Series o None: Fila del estudiante si se encuentra, None en caso contrario
+    """
+    return buscar_estudiante_detallado(df, run, anio)['estudiante']
 
 
 def main():
@@ -136,7 +196,16 @@ def main():
     # Cargar datos
     with st.spinner('Cargando base de datos de estudiantes...'):
         try:
-            df = cargar_datos()
+            base_datos = cargar_datos()
+            anios = base_datos.anios_disponibles()
+            if not anios:
+                raise FileNotFoundError("No hay datos de prematrícula")
+            anio = st.sidebar.selectbox(
+                "📅 Año escolar",
+                options=sorted(anios, reverse=True),
+                key="anio_escolar"
+            )
+            df = base_datos.particion(anio).datos
             st.sidebar.success(f"✅ Base de datos cargada: {len(df):,} estudiantes")
         except Exception as e:
             st.error(f"❌ Error al cargar la base de datos: {str(e)}")
@@ -156,7 +225,7 @@ def main():
         st.markdown("### 📊 Estadísticas")
         st.metric("Total estudiantes", f"{len(df):,}")
         st.metric("Establecimientos", df['NOM_RBD'].nunique())
-        st.metric("Año escolar", df['ANO_ESCOLAR'].iloc[0])
+        st.metric("Año escolar", anio)
         
         st.markdown("---")
         st.markdown("### 🔍 Formato RUN")
@@ -189,21 +258,22 @@ def main():
             st.error("❌ Por favor ingresa un RUN válido")
             st.stop()
         
-        # NO validar DV - el sistema lo calculará automáticamente
+        # El DV no se exige: la búsqueda lo usa para elegir cómo interpretar el RUN
         
         # Buscar estudiante
         with st.spinner('Buscando estudiante...'):
-            estudiante = buscar_estudiante(df, run_input)
+            resultado = buscar_estudiante_detallado(base_datos, run_input, anio)
+            estudiante = resultado['estudiante']
         
         if estudiante is None:
-            st.error("❌ **NO SE ENCONTRÓ** ningún estudiante con ese RUN en la base de prematrícula 2026")
+            st.error(f"❌ **NO SE ENCONTRÓ** ningún estudiante con ese RUN en la base de prematrícula {anio}")
             st.info(f"🔍 RUN buscado: **{run_input}**")
             
             # Ayuda adicional
             with st.expander("💡 Sugerencias"):
                 st.write("""
                 - Verifica que el RUN esté escrito correctamente
-                - Asegúrate que el estudiante esté en prematrícula 2026
+                - Asegúrate que el estudiante esté en prematrícula del año seleccionado
                 - Prueba sin puntos ni guión: solo números
                 - Contacta al administrador si el problema persiste
                 """)
@@ -213,6 +283,12 @@ def main():
             st.session_state['estudiante'] = estudiante
             st.session_state['run_formateado'] = formatear_run(estudiante['SAL_RUN'])
             st.session_state['curso_completo'] = formatear_curso(estudiante['COD_GRADO_GLOSA_PRE'], estudiante['LET_CUR_PRE'])
+            if resultado['ambiguo']:
+                st.session_state['runs_ambiguos'] = [
+                    formatear_run(e['SAL_RUN']) for e in resultado['coincidencias']
+                ]
+            else:
+                st.session_state.pop('runs_ambiguos', None)
     
     # MOSTRAR DATOS SI EXISTE EN SESSION STATE
     if 'estudiante' in st.session_state:
@@ -223,12 +299,22 @@ def main():
         # Mostrar datos del estudiante encontrado
         st.success("✅ **ESTUDIANTE ENCONTRADO**")
         
+        if 'runs_ambiguos' in st.session_state:
+            elegido, *otros = st.session_state['runs_ambiguos']
+            st.warning(
+                f"⚠️ El RUN ingresado coincide con más de un estudiante: "
+                f"{', '.join([elegido] + otros)}. Se muestra **{elegido}** "
+                f"(último dígito como DV). Para buscar otro, ingrésalo con guión "
+                f"(ej: {otros[0]})."
+            )
+        
         # Botón para nueva búsqueda
         if st.button("🔄 Buscar Otro Estudiante", type="secondary"):
             # Limpiar session state
             del st.session_state['estudiante']
             del st.session_state['run_formateado']
             del st.session_state['curso_completo']
+            st.session_state.pop('runs_ambiguos', None)
             st.rerun()
         
         # Mostrar información en columnas
@@ -292,14 +378,38 @@ def main():
                             'año': estudiante['ANO_ESCOLAR']
                         }
                         
-                        generador = GeneradorCertificado('template_certificado.docx')
-                        certificado_buffer = generador.generar_certificado(
-                            datos_certificado,
-                            fecha_emision=datetime.combine(fecha_emision, datetime.min.time())
+                        registro = obtener_registro_templates()
+                        template_path = registro.resolver(
+                            rbd=estudiante['RBD_PRE'],
+                            comuna=estudiante['NOM_COM_RBD']
+                        )
+                        fecha = datetime.combine(fecha_emision, datetime.min.time())
+                        
+                        # Certificado pre-generado: solo se completa el nombre
+                        almacen = obtener_almacen_certificados()
+                        clave = almacen.clave(
+                            estudiante['SAL_RUN'], template_path, fecha, datos_certificado
                         )
+                        certificado_buffer = None
+                        pregenerado = almacen.obtener(clave)
+                        if pregenerado is not None:
+                            certificado_buffer = GeneradorCertificado.completar_nombre(
+                                pregenerado, nombre_estudiante
+                            )
+                        
+                        if certificado_buffer is None:
+                            generador = GeneradorCertificado(
+                                template_path, cache=registro.cache, determinista=True
+                            )
+                            certificado_buffer = generador.generar_certificado(
+                                datos_certificado,
+                                fecha_emision=fecha
+                            )
                         
                         st.session_state['certificado'] = certificado_buffer
                         st.session_state['nombre_archivo'] = f"Certificado_{estudiante['SAL_RUN']}.docx"
+                        st.session_state['template_usado'] = template_path
+                        st.session_state['etag'] = calcular_etag(certificado_buffer)
                         st.success("✅ Certificado generado")
                         
                 except Exception as e:
@@ -307,6 +417,11 @@ def main():
         
         # Botón descarga FUERA
         if 'certificado' in st.session_state:
+            if 'template_usado' in st.session_state:
+                st.caption(
+                    f"📄 Template: {st.session_state['template_usado']} | "
+                    f"Huella: {st.session_state.get('etag', '')[1:13]}"
+                )
             st.download_button(
                 "📥 Descargar Certificado",
                 st.session_state['certificado'],
@@ -0,0 +1,255 @@
+"""
+Base de datos de prematrícula particionada por año escolar
+SLEP Santa Corina
+
+Cada año escolar se guarda en su propio archivo dentro de un directorio:
+
+    datos_por_anio/
+    ├── anio_2025.pkl
+    └── anio_2026.pkl
+
+Cada partición contiene los datos del año y su índice por RUN. Las
+particiones se cargan solo cuando se consultan y las menos usadas se
+liberan de memoria cuando se supera el límite configurado.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+PREFIJO_PARTICION = 'anio_'
+EXTENSION_PARTICION = '.pkl'
+MARCA_ACTUALIZACION = '.actualizado'
+
+
+def construir_indice(df):
+    """
+    Construye el índice RUN → posición de fila
+
+    Args:
+        df (DataFrame): Datos de un año escolar
+
+    Returns:
+        dict: {SAL_RUN: posición}. Si un RUN se repite se conserva la primera fila.
+    """
+    indice = {}
+    for posicion, run in enumerate(df['SAL_RUN'].tolist()):
+        indice.setdefault(int(run), posicion)
+    return indice
+
+
+def ruta_particion(directorio, anio):
+    """Ruta del archivo de la partición de un año"""
+    return os.path.join(directorio, f"{PREFIJO_PARTICION}{int(anio)}{EXTENSION_PARTICION}")
+
+
+def guardar_particiones(df, directorio, indices=None):
+    """
+    Divide un DataFrame por ANO_ESCOLAR y guarda una partición por año
+
+    Args:
+        df (DataFrame): Datos de prematrícula (uno o varios años)
+        directorio (str): Carpeta destino
+        indices (dict, optional): Índices ya construidos {año: {RUN: posición}},
+            por ejemplo los de ingesta.ColumnasCompactas. Si no se indican se
+            construyen desde los datos.
+
+    Returns:
+        list: Años guardados
+    """
+    os.makedirs(directorio, exist_ok=True)
+    anios = []
+    for anio, datos_anio in df.groupby('ANO_ESCOLAR', sort=True, observed=True):
+        datos_anio = datos_anio.reset_index(drop=True)
+        if indices is not None and int(anio) in indices:
+            indice = indices[int(anio)]
+        else:
+            indice = construir_indice(datos_anio)
+        # Escritura atómica: la aplicación puede estar leyendo la partición
+        path = ruta_particion(directorio, anio)
+        temporal = f"{path}.tmp"
+        pd.to_pickle({'datos': datos_anio, 'indice': indice}, temporal)
+        os.replace(temporal, path)
+        anios.append(int(anio))
+
+    # Marca de la última actualización (la usa preparar_particiones)
+    marca = os.path.join(directorio, MARCA_ACTUALIZACION)
+    with open(f"{marca}.tmp", 'w') as f:
+        f.write(','.join(str(a) for a in anios))
+    os.replace(f"{marca}.tmp", marca)
+    return anios
+
+
+def preparar_particiones(archivos_excel, directorio):
+    """
+    Genera las particiones desde uno o más Excel si no existen o están desactualizadas
+
+    Los años presentes en los Excel reemplazan a las particiones existentes;
+    los años anteriores que ya estaban particionados se conservan.
+
+    Args:
+        archivos_excel (str o list): Ruta(s) a los Excel de prematrícula
+        directorio (str): Carpeta de particiones
+
+    Returns:
+        bool: True si se regeneraron particiones
+    """
+    if isinstance(archivos_excel, str):
+        archivos_excel = [archivos_excel]
+    archivos_excel = [a for a in archivos_excel if os.path.exists(a)]
+    if not archivos_excel:
+        return False
+
+    marca = os.path.join(directorio, MARCA_ACTUALIZACION)
+    mtime_excel = max(os.path.getmtime(a) for a in archivos_excel)
+    if os.path.exists(marca) and os.path.getmtime(marca) >= mtime_excel:
+        return False
+
+    # Lectura fila a fila: solo columnas requeridas, sin materializar la hoja
+    from ingesta import cargar_compacto
+    datos, _ = cargar_compacto(archivos_excel)
+    guardar_particiones(datos.a_dataframe(), directorio, datos.indices)
+    return True
+
+
+class Particion:
+    """Datos e índice de un año escolar cargados en memoria"""
+
+    def __init__(self, anio, datos, indice, mtime=None):
+        self.anio = anio
+        self.datos = datos
+        self.indice = indice
+        self.mtime = mtime
+        self.memoria = int(datos.memory_usage(deep=True).sum())
+
+    def buscar(self, run):
+        """
+        Busca un RUN (sin DV) en la partición
+
+        Args:
+            run (int): RUN sin dígito verificador
+
+        Returns:
+            Series o None: Fila del estudiante si se encuentra
+        """
+        posicion = self.indice.get(run)
+        if posicion is None:
+            return None
+        return self.datos.iloc[posicion]
+
+
+class BaseDatosPorAnio:
+    """Acceso a la prematrícula de varios años, cargando cada año bajo demanda"""
+
+    def __init__(self, directorio, max_memoria_mb=512):
+        """
+        Inicializa la base de datos
+
+        Args:
+            directorio (str): Carpeta con las particiones anio_<AÑO>.pkl
+            max_memoria_mb (float): Memoria máxima para particiones cargadas.
+                Al superarla se liberan los años menos consultados.
+        """
+        self.directorio = directorio
+        self.max_memoria = int(max_memoria_mb * 1024 * 1024)
+        self._particiones = OrderedDict()
+        self._lock = threading.Lock()
+
+    def anios_disponibles(self):
+        """
+        Lista los años escolares con partición en disco
+
+        Returns:
+            list: Años ordenados de menor a mayor
+        """
+        if not os.path.isdir(self.directorio):
+            return []
+        anios = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith(PREFIJO_PARTICION) and nombre.endswith(EXTENSION_PARTICION):
+                anio = nombre[len(PREFIJO_PARTICION):-len(EXTENSION_PARTICION)]
+                if anio.isdigit():
+                    anios.append(int(anio))
+        return sorted(anios)
+
+    def anio_actual(self):
+        """Año escolar más reciente disponible (o None si no hay datos)"""
+        anios = self.anios_disponibles()
+        return anios[-1] if anios else None
+
+    def particion(self, anio=None):
+        """
+        Obtiene la partición de un año, cargándola si no está en memoria o
+        si el archivo cambió (por ejemplo, después de ejecutar ingesta.py)
+
+        Args:
+            anio (int, optional): Año escolar. Por defecto el más reciente.
+
+        Returns:
+            Particion: Datos e índice del año
+
+        Raises:
+            FileNotFoundError: Si no hay datos para ese año
+        """
+        if anio is None:
+            anio = self.anio_actual()
+            if anio is None:
+                raise FileNotFoundError(f"No hay particiones en {self.directorio}")
+        anio = int(anio)
+
+        path = ruta_particion(self.directorio, anio)
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._particiones.pop(anio, None)
+            raise FileNotFoundError(f"No hay datos de prematrícula para el año {anio}")
+
+        with self._lock:
+            particion = self._particiones.get(anio)
+            if particion is not None and particion.mtime == mtime:
+                self._particiones.move_to_end(anio)
+                return particion
+
+        contenido = pd.read_pickle(path)
+        particion = Particion(anio, contenido['datos'], contenido['indice'], mtime)
+
+        with self._lock:
+            self._particiones[anio] = particion
+            self._particiones.move_to_end(anio)
+            self._liberar_memoria()
+
+        return particion
+
+    def _liberar_memoria(self):
+        """Libera los años menos usados hasta respetar el límite (conserva el último)"""
+        while len(self._particiones) > 1 and self.memoria_usada() > self.max_memoria:
+            self._particiones.popitem(last=False)
+
+    def memoria_usada(self):
+        """Memoria aproximada (bytes) de las particiones cargadas"""
+        return sum(p.memoria for p in self._particiones.values())
+
+    def anios_cargados(self):
+        """Años actualmente en memoria, del menos al más recientemente usado"""
+        return list(self._particiones.keys())
+
+    def buscar(self, run, anio=None):
+        """
+        Busca un RUN (sin DV) consultando solo la partición del año pedido
+
+        Args:
+            run (int): RUN sin dígito verificador
+            anio (int, optional): Año escolar. Por defecto el más reciente.
+
+        Returns:
+            Series o None: Fila del estudiante si se encuentra
+        """
+        try:
+            particion = self.particion(anio)
+        except FileNotFoundError:
+            return None
+        return particion.buscar(run)
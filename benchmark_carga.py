@@ -0,0 +1,102 @@
+"""
+Benchmark de carga de la base de prematrícula
+SLEP Santa Corina
+
+Compara la carga original (pd.read_excel de la hoja completa, como hacía
+cargar_datos) con la lectura fila a fila de ingesta.cargar_compacto.
+Cada medición corre en un proceso nuevo para que la memoria máxima (RSS)
+de una no afecte a la otra.
+
+Uso:
+    python benchmark_carga.py [archivo.xlsx] [--repeticiones 3]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+
+def _rss_pico_mb():
+    """Memoria máxima (RSS) del proceso actual en MB"""
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS reporta bytes
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def medir(modo, archivo):
+    """
+    Carga el archivo con el modo indicado y mide tiempo y memoria
+
+    Args:
+        modo (str): 'pandas' (carga original) o 'streaming'
+        archivo (str): Ruta al Excel
+
+    Returns:
+        dict: Tiempo, RSS antes y pico, tamaño final y filas
+    """
+    import pandas as pd
+    import ingesta  # noqa: F401 (importar antes de medir la memoria base)
+
+    rss_base = _rss_pico_mb()
+    inicio = time.perf_counter()
+
+    if modo == 'pandas':
+        df = pd.read_excel(archivo)
+    else:
+        datos, _ = ingesta.cargar_compacto(archivo, max_procesos=1)
+        df = datos.a_dataframe()
+
+    return {
+        'modo': modo,
+        'segundos': time.perf_counter() - inicio,
+        'rss_base_mb': rss_base,
+        'rss_pico_mb': _rss_pico_mb(),
+        'datos_mb': df.memory_usage(deep=True).sum() / (1024 * 1024),
+        'filas': len(df),
+    }
+
+
+def _medir_en_subproceso(modo, archivo):
+    salida = subprocess.run(
+        [sys.executable, __file__, '--modo', modo, archivo],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga de prematrícula")
+    parser.add_argument('archivo', nargs='?', default='datos_prematricula.xlsx')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--modo', choices=['pandas', 'streaming'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Proceso hijo: una sola medición
+    if args.modo:
+        print(json.dumps(medir(args.modo, args.archivo)))
+        return
+
+    print(f"Archivo: {args.archivo} ({args.repeticiones} repeticiones)\n")
+    print(f"{'MODO':<10} {'FILAS':>8} {'SEG.':>7} {'RSS PICO':>9} {'Δ RSS':>8} {'DATOS':>8}")
+    print("-" * 55)
+
+    resumen = {}
+    for modo in ('pandas', 'streaming'):
+        mediciones = [_medir_en_subproceso(modo, args.archivo) for _ in range(args.repeticiones)]
+        mejor = min(mediciones, key=lambda m: m['segundos'])
+        delta = max(m['rss_pico_mb'] - m['rss_base_mb'] for m in mediciones)
+        resumen[modo] = (mejor['segundos'], delta)
+        print(f"{modo:<10} {mejor['filas']:>8,} {mejor['segundos']:>7.2f} "
+              f"{mejor['rss_pico_mb']:>7.1f}MB {delta:>6.1f}MB {mejor['datos_mb']:>6.1f}MB")
+
+    seg_pandas, rss_pandas = resumen['pandas']
+    seg_stream, rss_stream = resumen['streaming']
+    print(f"\nTiempo: {seg_pandas / seg_stream:.2f}x | "
+          f"Memoria adicional durante la carga: {rss_pandas / max(rss_stream, 0.1):.2f}x menos")
+
+
+if __name__ == "__main__":
+    main()
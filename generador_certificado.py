@@ -6,22 +6,104 @@ VERSIÓN MEJORADA - Funciona con cualquier template
 
 from docx import Document
 from datetime import datetime
+from xml.sax.saxutils import escape
+import hashlib
 import io
 import re
+import zipfile
+
+from perfilador import perfilado
+
+
+# Parámetros fijos del ZIP para que datos idénticos produzcan bytes idénticos
+FECHA_ZIP_FIJA = (1980, 1, 1, 0, 0, 0)
+NIVEL_COMPRESION = 6
+
+
+def _orden_entrada_docx(nombre):
+    """[Content_Types].xml primero (convención OPC) y luego orden alfabético"""
+    return (nombre != '[Content_Types].xml', nombre)
+
+
+def empaquetar_determinista(entradas):
+    """
+    Arma un .docx con orden, fechas y compresión fijos
+    
+    Args:
+        entradas (dict): {nombre de la entrada en el ZIP: bytes}
+        
+    Returns:
+        io.BytesIO: Documento en memoria
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as destino:
+        for nombre in sorted(entradas, key=_orden_entrada_docx):
+            info = zipfile.ZipInfo(nombre, date_time=FECHA_ZIP_FIJA)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.create_system = 0
+            info.external_attr = 0o600 << 16
+            destino.writestr(info, entradas[nombre], compresslevel=NIVEL_COMPRESION)
+    buffer.seek(0)
+    return buffer
+
+
+def normalizar_docx(contenido):
+    """
+    Reescribe un .docx en forma determinista (ver empaquetar_determinista)
+    
+    Args:
+        contenido (bytes): Documento .docx
+        
+    Returns:
+        io.BytesIO: Documento equivalente con bytes reproducibles
+    """
+    with zipfile.ZipFile(io.BytesIO(contenido)) as origen:
+        entradas = {info.filename: origen.read(info) for info in origen.infolist()}
+    return empaquetar_determinista(entradas)
+
+
+def calcular_etag(contenido):
+    """
+    ETag HTTP a partir del contenido (sirve para cache y deduplicación)
+    
+    Args:
+        contenido (bytes o io.BytesIO): Documento
+        
+    Returns:
+        str: ETag entre comillas (ej: '"3f2a..."')
+    """
+    if isinstance(contenido, io.BytesIO):
+        contenido = contenido.getvalue()
+    return f'"{hashlib.sha256(contenido).hexdigest()[:32]}"'
 
 
 class GeneradorCertificado:
     """Clase para generar certificados de matrícula personalizados"""
     
-    def __init__(self, template_path):
+    # Nombre usado en certificados pre-generados (se completa al descargar)
+    NOMBRE_PENDIENTE = 'NOMBRE PENDIENTE'
+    
+    # Marca temporal del nombre mientras se aplican los demás patrones
+    # (carácter de uso privado: no coincide con ningún patrón)
+    _MARCA_NOMBRE = '\ue000'
+    
+    def __init__(self, template_path, cache=None, determinista=False):
         """
         Inicializa el generador con la ruta del template
         
         Args:
             template_path (str): Ruta al archivo .docx template
+            cache (CacheTemplates, optional): Cache compartido de templates
+                compilados. Si no se indica, el template se lee en cada certificado.
+            determinista (bool): Guardar con fechas, orden y compresión fijos,
+                para que datos idénticos produzcan exactamente los mismos bytes
         """
         self.template_path = template_path
+        self.cache = cache
+        self.determinista = determinista
+        self.template_usado = None
     
+    @perfilado('generar_certificado')
     def generar_certificado(self, datos_estudiante, fecha_emision=None):
         """
         Genera un certificado de matrícula personalizado
@@ -39,8 +121,18 @@ class GeneradorCertificado:
         Returns:
             io.BytesIO: Documento Word en memoria
         """
-        # Cargar el template
-        doc = Document(self.template_path)
+        # Cargar el template (desde el cache si está disponible)
+        if self.cache is not None:
+            template = self.cache.obtener(self.template_path)
+            doc = template.nuevo_documento()
+            todos = doc.paragraphs  # Se construye una sola vez (cada acceso recorre el cuerpo)
+            parrafos = [todos[i] for i in template.indices_parrafos]
+            tablas = doc.tables if template.tiene_tablas else []
+        else:
+            doc = Document(self.template_path)
+            parrafos = doc.paragraphs
+            tablas = doc.tables
+        self.template_usado = self.template_path
         
         # Usar fecha actual si no se proporciona
         if fecha_emision is None:
@@ -50,23 +142,61 @@ class GeneradorCertificado:
         fecha_formateada = self._formatear_fecha(fecha_emision)
         
         # Reemplazar en párrafos
-        for para in doc.paragraphs:
+        for para in parrafos:
             self._reemplazar_en_texto(para, datos_estudiante, fecha_formateada)
         
         # Reemplazar en tablas (si las hay)
-        for table in doc.tables:
+        for table in tablas:
             for row in table.rows:
                 for cell in row.cells:
                     for para in cell.paragraphs:
                         self._reemplazar_en_texto(para, datos_estudiante, fecha_formateada)
         
-        # Guardar en memoria
+        # Guardar en memoria (el documento compilado se empaqueta una sola vez)
+        if self.determinista and self.cache is not None:
+            return empaquetar_determinista(doc.entradas())
+        
         buffer = io.BytesIO()
         doc.save(buffer)
-        buffer.seek(0)
         
+        if self.determinista:
+            return normalizar_docx(buffer.getvalue())
+        
+        buffer.seek(0)
         return buffer
     
+    @classmethod
+    def completar_nombre(cls, contenido, nombre):
+        """
+        Completa el nombre en un certificado pre-generado con NOMBRE_PENDIENTE
+        
+        Solo se reescribe word/document.xml dentro del .docx; el resto del
+        archivo se copia tal cual, sin volver a procesar el template. El
+        nombre queda igual que al generar en el momento (en ambos casos se
+        inserta después de los demás patrones) y el resultado se guarda en
+        forma determinista.
+        
+        Args:
+            contenido (bytes): Certificado pre-generado
+            nombre (str): Nombre completo del estudiante
+            
+        Returns:
+            io.BytesIO o None: Documento con el nombre, o None si el
+            certificado no tiene el nombre pendiente
+        """
+        marcador = f"Don(a) {cls.NOMBRE_PENDIENTE}".encode('utf-8')
+        reemplazo = f"Don(a) {escape(nombre.upper())}".encode('utf-8')
+        
+        with zipfile.ZipFile(io.BytesIO(contenido)) as origen:
+            entradas = {info.filename: origen.read(info) for info in origen.infolist()}
+        
+        documento = entradas.get('word/document.xml', b'')
+        if marcador not in documento:
+            return None
+        entradas['word/document.xml'] = documento.replace(marcador, reemplazo)
+        
+        return empaquetar_determinista(entradas)
+    
     def _reemplazar_en_texto(self, para, datos, fecha):
         """
         Reemplaza los placeholders en un párrafo usando patrones inteligentes
@@ -85,12 +215,14 @@ class GeneradorCertificado:
         texto_nuevo = texto_original
         
         # PATRÓN 1: Buscar "Don(a) NOMBRE, RUN"
-        # Captura nombres en mayúsculas antes de una coma
+        # Captura nombres en mayúsculas antes de una coma. El nombre se
+        # inserta al final, para que los demás patrones no lo modifiquen
+        # (igual que completar_nombre en los certificados pre-generados)
         patron_nombre = r'Don\(a\)\s+([A-ZÁÉÍÓÚÑ\s]+?)(?=,)'
         if re.search(patron_nombre, texto_nuevo, re.IGNORECASE):
             texto_nuevo = re.sub(
                 patron_nombre, 
-                f"Don(a) {datos.get('nombre', '').upper()}", 
+                f"Don(a) {self._MARCA_NOMBRE}", 
                 texto_nuevo,
                 flags=re.IGNORECASE
             )
@@ -138,6 +270,8 @@ class GeneradorCertificado:
                     datos.get('establecimiento', '').upper()
                 )
         
+        texto_nuevo = texto_nuevo.replace(self._MARCA_NOMBRE, datos.get('nombre', '').upper())
+        
         # Si hubo cambios, actualizar el párrafo
         if texto_nuevo != texto_original:
             # Limpiar runs existentes
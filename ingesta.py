@@ -0,0 +1,469 @@
+"""
+Ingesta de exportaciones de prematrícula (varios Excel y/o varias hojas)
+SLEP Santa Corina
+
+Lee todos los .xlsx de un directorio (o un patrón glob), procesa cada hoja
+en paralelo con un pool de procesos usando el modo de solo lectura de
+openpyxl, normaliza las columnas al esquema que usa la aplicación y une
+todo en un solo conjunto sin RUN duplicados.
+
+Las filas se leen una a una y solo se guardan las columnas requeridas, en
+arreglos compactos, junto con el índice por RUN: la memoria máxima durante
+la carga queda cerca del tamaño final de los datos (ver benchmark_carga.py).
+
+Uso:
+    python ingesta.py exportaciones/ --destino datos_por_anio
+    python ingesta.py "exportaciones/*_2026.xlsx"
+"""
+
+import glob
+import os
+import re
+import time
+import unicodedata
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from utils import calcular_dv, limpiar_run
+
+
+# Columnas que usa app.py
+COLUMNAS_REQUERIDAS = [
+    'ANO_ESCOLAR',
+    'NOM_COM_RBD',
+    'RBD_PRE',
+    'NOM_RBD',
+    'SAL_RUN',
+    'LET_CUR_PRE',
+    'COD_GRADO_GLOSA_PRE',
+]
+
+# Nombres alternativos que aparecen en algunas exportaciones. LET_CUR y
+# COD_GRADO_GLOSA no son alias: corresponden al curso del año en curso, no
+# al de prematrícula. Los nombres exactos del esquema tienen prioridad.
+ALIAS_COLUMNAS = {
+    'RUN': 'SAL_RUN',
+    'RUN_ALUMNO': 'SAL_RUN',
+    'MRUN': 'SAL_RUN',
+    'AGNO': 'ANO_ESCOLAR',
+    'AGNO_ESCOLAR': 'ANO_ESCOLAR',
+    'ANO': 'ANO_ESCOLAR',
+    'ANIO': 'ANO_ESCOLAR',
+    'ANIO_ESCOLAR': 'ANO_ESCOLAR',
+    'RBD': 'RBD_PRE',
+    'NOMBRE_RBD': 'NOM_RBD',
+    'NOMBRE_ESTABLECIMIENTO': 'NOM_RBD',
+    'NOM_ESTABLECIMIENTO': 'NOM_RBD',
+    'COMUNA': 'NOM_COM_RBD',
+    'NOM_COMUNA': 'NOM_COM_RBD',
+    'NOM_COM': 'NOM_COM_RBD',
+    'LETRA': 'LET_CUR_PRE',
+    'LETRA_CURSO': 'LET_CUR_PRE',
+    'GRADO': 'COD_GRADO_GLOSA_PRE',
+    'GLOSA_GRADO': 'COD_GRADO_GLOSA_PRE',
+}
+
+COLUMNAS_ENTERAS = ('ANO_ESCOLAR', 'RBD_PRE', 'SAL_RUN')
+COLUMNAS_TEXTO = tuple(c for c in COLUMNAS_REQUERIDAS if c not in COLUMNAS_ENTERAS)
+
+
+def normalizar_columna(nombre):
+    """
+    Normaliza el encabezado de una columna al esquema de la aplicación
+
+    Args:
+        nombre (str): Encabezado tal como viene en el Excel (ej: "Año Escolar")
+
+    Returns:
+        str: Nombre normalizado (ej: "ANO_ESCOLAR")
+    """
+    texto = _normalizar_texto(nombre)
+    return ALIAS_COLUMNAS.get(texto, texto)
+
+
+def _normalizar_texto(nombre):
+    """Encabezado en mayúsculas, sin tildes y con '_' (sin aplicar alias)"""
+    if nombre is None:
+        return None
+    texto = unicodedata.normalize('NFKD', str(nombre))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'[^A-Z0-9]+', '_', texto.upper()).strip('_')
+
+
+def _a_entero(valor):
+    """Convierte un valor de celda a entero (acepta números con puntos)"""
+    if valor is None:
+        return None
+    if isinstance(valor, (int, float)):
+        return int(valor)
+    texto = limpiar_run(valor)
+    return int(texto) if texto.isdigit() else None
+
+
+def _a_run(valor):
+    """
+    Convierte un RUN de celda a entero sin DV
+
+    Args:
+        valor: RUN sin DV (12345678, "12.345.678") o con DV separado por
+            guión ("12.345.678-5")
+
+    Returns:
+        int o None: RUN sin DV, o None si el DV no corresponde
+    """
+    if isinstance(valor, str) and '-' in valor:
+        cuerpo, dv = valor.strip().rsplit('-', 1)
+        cuerpo = limpiar_run(cuerpo)
+        if not cuerpo.isdigit() or calcular_dv(cuerpo) != dv.strip().upper():
+            return None
+        return int(cuerpo)
+    return _a_entero(valor)
+
+
+# Conversión de cada columna entera
+_CONVERSORES = {'ANO_ESCOLAR': _a_entero, 'RBD_PRE': _a_entero, 'SAL_RUN': _a_run}
+
+
+def listar_archivos(origen):
+    """
+    Lista los Excel a procesar
+
+    Args:
+        origen (str): Directorio, patrón glob o ruta a un archivo .xlsx
+
+    Returns:
+        list: Rutas ordenadas
+    """
+    if os.path.isdir(origen):
+        patron = os.path.join(origen, '*.xlsx')
+    else:
+        patron = origen
+    return sorted(
+        a for a in glob.glob(patron)
+        if a.lower().endswith('.xlsx') and not os.path.basename(a).startswith('~$')
+    )
+
+
+def listar_hojas(archivo):
+    """Nombres de las hojas de un Excel, sin cargar su contenido"""
+    wb = load_workbook(archivo, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+class ColumnasCompactas:
+    """
+    Datos de prematrícula en arreglos compactos, construidos fila a fila
+
+    Las columnas numéricas se guardan en array('q') y las de texto como
+    códigos array('i') más su lista de categorías (hay pocos valores
+    distintos: comunas, establecimientos, grados y letras). Así la memoria
+    durante la lectura se mantiene cerca del tamaño final de los datos.
+    Los RUN repetidos dentro de un mismo año se descartan al agregarlos.
+    """
+
+    def __init__(self):
+        self.enteros = {c: array('q') for c in COLUMNAS_ENTERAS}
+        self.codigos = {c: array('i') for c in COLUMNAS_TEXTO}
+        self.categorias = {c: {} for c in COLUMNAS_TEXTO}
+        # Índice por año: {ANO_ESCOLAR: {SAL_RUN: posición dentro del año}}
+        self.indices = {}
+
+    def __len__(self):
+        return len(self.enteros['SAL_RUN'])
+
+    def agregar(self, enteros, textos):
+        """
+        Agrega una fila
+
+        Args:
+            enteros (dict): Valores de COLUMNAS_ENTERAS
+            textos (dict): Valores de COLUMNAS_TEXTO
+
+        Returns:
+            bool: False si el RUN ya existía para ese año (fila descartada)
+        """
+        indice_anio = self.indices.setdefault(enteros['ANO_ESCOLAR'], {})
+        if enteros['SAL_RUN'] in indice_anio:
+            return False
+        indice_anio[enteros['SAL_RUN']] = len(indice_anio)
+
+        for c in COLUMNAS_ENTERAS:
+            self.enteros[c].append(enteros[c])
+        for c in COLUMNAS_TEXTO:
+            categorias = self.categorias[c]
+            codigo = categorias.get(textos[c])
+            if codigo is None:
+                codigo = categorias[textos[c]] = len(categorias)
+            self.codigos[c].append(codigo)
+        return True
+
+    def unir(self, otra):
+        """
+        Agrega las filas de otro conjunto, descartando RUN ya existentes por año
+
+        Args:
+            otra (ColumnasCompactas): Datos a agregar
+
+        Returns:
+            int: Cantidad de filas duplicadas descartadas
+        """
+        textos_otra = {c: list(otra.categorias[c]) for c in COLUMNAS_TEXTO}
+        duplicados = 0
+        for i in range(len(otra)):
+            enteros = {c: otra.enteros[c][i] for c in COLUMNAS_ENTERAS}
+            textos = {c: textos_otra[c][otra.codigos[c][i]] for c in COLUMNAS_TEXTO}
+            if not self.agregar(enteros, textos):
+                duplicados += 1
+        return duplicados
+
+    def a_dataframe(self):
+        """
+        Convierte los arreglos en un DataFrame sin copiar las columnas numéricas
+
+        Returns:
+            DataFrame: Columnas en el orden de COLUMNAS_REQUERIDAS; las de texto
+            como categóricas
+        """
+        columnas = {}
+        for c in COLUMNAS_REQUERIDAS:
+            if c in self.enteros:
+                columnas[c] = np.frombuffer(self.enteros[c], dtype=np.int64)
+            else:
+                columnas[c] = pd.Categorical.from_codes(
+                    np.frombuffer(self.codigos[c], dtype=np.int32),
+                    categories=list(self.categorias[c])
+                )
+        return pd.DataFrame(columnas, copy=False)
+
+
+def leer_hoja(archivo, hoja):
+    """
+    Lee una hoja fila a fila y la normaliza al esquema de la aplicación
+
+    Solo se conservan las columnas requeridas, que se acumulan directamente
+    en arreglos compactos. Se ejecuta en un proceso del pool.
+
+    Args:
+        archivo (str): Ruta al Excel
+        hoja (str): Nombre de la hoja
+
+    Returns:
+        dict: {'archivo', 'hoja', 'datos' (ColumnasCompactas), 'filas',
+               'descartadas', 'duplicados', 'segundos', 'error'}
+    """
+    inicio = time.perf_counter()
+    resultado = _resultado_vacio(archivo, hoja)
+
+    wb = None
+    try:
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        if not hasattr(wb[hoja], 'iter_rows'):
+            resultado['error'] = 'No es una hoja de datos (gráfico)'
+            return resultado
+
+        filas = wb[hoja].iter_rows(values_only=True)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            resultado['error'] = 'Hoja vacía'
+            return resultado
+
+        # Posición de cada columna requerida: primero los nombres exactos
+        # del esquema y luego los alias (la primera si se repite)
+        textos_encabezado = [_normalizar_texto(nombre) for nombre in encabezado]
+        posiciones = {}
+        for usar_alias in (False, True):
+            for i, texto in enumerate(textos_encabezado):
+                columna = ALIAS_COLUMNAS.get(texto, texto) if usar_alias else texto
+                if columna in COLUMNAS_REQUERIDAS and columna not in posiciones:
+                    posiciones[columna] = i
+
+        faltantes = [c for c in COLUMNAS_REQUERIDAS if c not in posiciones]
+        if faltantes:
+            resultado['error'] = f"Faltan columnas: {', '.join(faltantes)}"
+            return resultado
+
+        datos = ColumnasCompactas()
+        for fila in filas:
+            largo = len(fila)
+            enteros = {
+                c: _CONVERSORES[c](fila[posiciones[c]]) if posiciones[c] < largo else None
+                for c in COLUMNAS_ENTERAS
+            }
+            if any(v is None for v in enteros.values()):
+                resultado['descartadas'] += 1
+                continue
+
+            textos = {}
+            for c in COLUMNAS_TEXTO:
+                valor = fila[posiciones[c]] if posiciones[c] < largo else None
+                textos[c] = '' if valor is None else str(valor).strip()
+
+            if not datos.agregar(enteros, textos):
+                resultado['duplicados'] += 1
+
+        resultado['datos'] = datos
+        resultado['filas'] = len(datos)
+    except Exception as e:
+        # Un archivo dañado o bloqueado no detiene el resto de la ingesta
+        resultado.update(datos=None, filas=0, error=_describir_error(e))
+    finally:
+        if wb is not None:
+            wb.close()
+        resultado['segundos'] = time.perf_counter() - inicio
+
+    return resultado
+
+
+def _resultado_vacio(archivo, hoja):
+    """Resultado de leer_hoja sin filas"""
+    return {
+        'archivo': archivo,
+        'hoja': hoja,
+        'datos': None,
+        'filas': 0,
+        'descartadas': 0,
+        'duplicados': 0,
+        'segundos': 0.0,
+        'error': None,
+    }
+
+
+def _describir_error(error):
+    return f"{type(error).__name__}: {error}"
+
+
+def _leer_hoja_tarea(tarea):
+    """Adaptador para ProcessPoolExecutor.map"""
+    return leer_hoja(*tarea)
+
+
+def cargar_compacto(origen, max_procesos=None):
+    """
+    Lee todas las hojas de todos los Excel (en paralelo si hay varias) y las une
+
+    Los RUN repetidos dentro de un mismo año escolar se eliminan conservando
+    la primera aparición (en orden de archivo y hoja). Un mismo RUN en años
+    distintos se conserva, para no perder años anteriores.
+
+    Args:
+        origen (str o list): Directorio, patrón glob, archivo .xlsx o lista de archivos
+        max_procesos (int, optional): Procesos del pool (por defecto, uno por CPU)
+
+    Returns:
+        tuple: (ColumnasCompactas, list de reportes por hoja más una fila TOTAL,
+            con el tiempo total transcurrido)
+    """
+    inicio = time.perf_counter()
+    if isinstance(origen, (list, tuple)):
+        archivos = sorted(a for a in origen if os.path.exists(a))
+    else:
+        archivos = listar_archivos(origen)
+    if not archivos:
+        raise FileNotFoundError(f"No se encontraron archivos .xlsx en {origen}")
+
+    tareas = []
+    errores = []
+    for archivo in archivos:
+        try:
+            hojas = listar_hojas(archivo)
+        except Exception as e:
+            errores.append(dict(_resultado_vacio(archivo, ''), error=_describir_error(e)))
+            continue
+        tareas.extend((archivo, hoja) for hoja in hojas)
+
+    if len(tareas) <= 1 or max_procesos == 1:
+        resultados = [_leer_hoja_tarea(t) for t in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=max_procesos) as pool:
+            resultados = list(pool.map(_leer_hoja_tarea, tareas))
+    resultados = sorted(resultados + errores, key=lambda r: r['archivo'])
+
+    partes = [r['datos'] for r in resultados if r['datos'] is not None]
+    datos = partes[0] if partes else ColumnasCompactas()
+    duplicados = sum(r['duplicados'] for r in resultados)
+    for parte in partes[1:]:
+        duplicados += datos.unir(parte)
+
+    reportes = []
+    for r in resultados:
+        reportes.append({
+            'archivo': r['archivo'],
+            'hoja': r['hoja'],
+            'filas': r['filas'],
+            'descartadas': r['descartadas'],
+            'duplicados': r['duplicados'],
+            'segundos': r['segundos'],
+            'error': r['error'],
+        })
+    reportes.append({
+        'archivo': 'TOTAL',
+        'hoja': '',
+        'filas': len(datos),
+        'descartadas': sum(r['descartadas'] for r in resultados),
+        'duplicados': duplicados,
+        # Tiempo real: con varias hojas en paralelo es menor que la suma
+        'segundos': time.perf_counter() - inicio,
+        'error': None,
+    })
+
+    return datos, reportes
+
+
+def ingerir(origen, max_procesos=None):
+    """
+    Igual que cargar_compacto, pero retorna un DataFrame
+
+    Args:
+        origen (str o list): Directorio, patrón glob, archivo .xlsx o lista de archivos
+        max_procesos (int, optional): Procesos del pool (por defecto, uno por CPU)
+
+    Returns:
+        tuple: (DataFrame unido, list de reportes por hoja más una fila TOTAL)
+    """
+    datos, reportes = cargar_compacto(origen, max_procesos)
+    return datos.a_dataframe(), reportes
+
+
+def imprimir_reporte(reportes):
+    """Muestra el resumen de la ingesta por archivo y hoja"""
+    print(f"{'ARCHIVO':<40} {'HOJA':<20} {'FILAS':>8} {'DESCART.':>9} {'DUPLIC.':>8} {'SEG.':>7}")
+    print("-" * 97)
+    for r in reportes:
+        nombre = os.path.basename(r['archivo'])
+        print(f"{nombre[:40]:<40} {str(r['hoja'])[:20]:<20} {r['filas']:>8,} "
+              f"{r['descartadas']:>9,} {r['duplicados']:>8,} {r['segundos']:>7.2f}")
+        if r['error']:
+            print(f"   ✗ {r['error']}")
+
+
+def main():
+    """Punto de entrada por línea de comandos"""
+    import argparse
+    from base_datos import guardar_particiones
+
+    parser = argparse.ArgumentParser(description="Ingesta de exportaciones de prematrícula")
+    parser.add_argument('origen', help="Directorio, patrón glob o archivo .xlsx")
+    parser.add_argument('--destino', default='datos_por_anio',
+                        help="Carpeta de particiones por año (por defecto: datos_por_anio)")
+    parser.add_argument('--procesos', type=int, default=None,
+                        help="Cantidad de procesos en paralelo (por defecto: uno por CPU)")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    datos, reportes = cargar_compacto(args.origen, max_procesos=args.procesos)
+    imprimir_reporte(reportes)
+
+    anios = guardar_particiones(datos.a_dataframe(), args.destino, datos.indices)
+    print(f"\n✓ {len(datos):,} estudiantes en {args.destino} (años: {anios}) "
+          f"en {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Perfilador por muestreo para solicitudes lentas
+SLEP Santa Corina
+
+Se activa con variables de entorno (por defecto está desactivado y el
+decorador no agrega costo):
+
+    CERTIFICADOS_PERFIL=1                  Activa el perfilador
+    CERTIFICADOS_PERFIL_UMBRAL_MS=500      Solo se guardan solicitudes más lentas
+    CERTIFICADOS_PERFIL_DIR=perfiles       Carpeta de salida
+    CERTIFICADOS_PERFIL_MAX=20             Se conservan las N solicitudes más lentas
+    CERTIFICADOS_PERFIL_INTERVALO_MS=5     Intervalo entre muestras
+    CERTIFICADOS_PERFIL_TASA=1.0           Fracción de solicitudes a muestrear
+    CERTIFICADOS_PERFIL_CLAVE=...          Clave para el hash de los RUN (por
+                                           defecto, una clave aleatoria por proceso)
+
+Un único hilo toma muestras de la pila de los hilos con solicitudes en
+curso. Por cada solicitud lenta se escriben dos archivos:
+
+    <fecha>_<funcion>_<ms>ms.collapsed.txt  Pilas colapsadas (speedscope, flamegraph.pl)
+    <fecha>_<funcion>_<ms>ms.json           Duración y entradas anonimizadas
+"""
+
+import functools
+import hashlib
+import heapq
+import hmac
+import json
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from utils import limpiar_run
+
+
+# Clave del HMAC de los RUN: sin ella no se puede recuperar un RUN probando
+# todos los posibles. Si no se configura, es aleatoria y los hashes solo
+# coinciden entre perfiles del mismo proceso.
+_CLAVE_RUN = (os.environ.get('CERTIFICADOS_PERFIL_CLAVE', '').encode('utf-8')
+              or secrets.token_bytes(32))
+
+
+def _env_float(nombre, defecto):
+    try:
+        return float(os.environ.get(nombre, defecto))
+    except ValueError:
+        return defecto
+
+
+def anonimizar(valor):
+    """
+    Reemplaza datos personales por valores no identificables
+
+    Los RUN se reemplazan por un HMAC corto con clave secreta (permite
+    reconocer la misma solicitud sin exponer el RUN) y los nombres por su
+    largo. Los datos del establecimiento y curso se conservan, al igual que
+    el template de un GeneradorCertificado (para reproducir la solicitud).
+
+    Args:
+        valor: Argumento de la solicitud
+
+    Returns:
+        Valor serializable en JSON sin datos personales
+    """
+    if isinstance(valor, dict):
+        resultado = {}
+        for clave, v in valor.items():
+            if clave == 'nombre':
+                resultado[clave] = f"<{len(str(v))} caracteres>"
+            elif clave == 'run':
+                resultado[clave] = _hash_run(v)
+            else:
+                resultado[clave] = anonimizar(v)
+        return resultado
+    if isinstance(valor, bool) or valor is None:
+        return valor
+    if isinstance(valor, (int, str)):
+        if _parece_run(valor):
+            return _hash_run(valor)
+        return valor if isinstance(valor, str) else int(valor)
+    if isinstance(valor, float):
+        return valor
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if hasattr(valor, 'item'):
+        # Escalares de numpy (ej: RBD_PRE, ANO_ESCOLAR de un DataFrame)
+        return anonimizar(valor.item())
+    if hasattr(valor, 'template_path'):
+        # GeneradorCertificado: el template no es un dato personal
+        return {'tipo': type(valor).__name__, 'template_path': str(valor.template_path)}
+    return f"<{type(valor).__name__}>"
+
+
+def _parece_run(valor):
+    """True si el valor tiene forma de RUN (7 a 10 caracteres, con o sin DV)"""
+    texto = limpiar_run(valor).upper()
+    return 7 <= len(texto) <= 10 and texto[:-1].isdigit() and (texto[-1].isdigit() or texto[-1] == 'K')
+
+
+def _hash_run(valor):
+    mensaje = limpiar_run(valor).upper().encode('utf-8')
+    return 'run:' + hmac.new(_CLAVE_RUN, mensaje, hashlib.sha256).hexdigest()[:10]
+
+
+class _Solicitud:
+    """Muestras de pila de una solicitud en curso"""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.muestras = Counter()
+
+
+class Perfilador:
+    """Muestrea las pilas de las solicitudes en curso y guarda las más lentas"""
+
+    def __init__(self, directorio='perfiles', umbral_ms=500, max_perfiles=20,
+                 intervalo_ms=5, tasa=1.0):
+        """
+        Inicializa el perfilador
+
+        Args:
+            directorio (str): Carpeta donde se guardan los perfiles
+            umbral_ms (float): Duración mínima para guardar una solicitud
+            max_perfiles (int): Cantidad de perfiles (los más lentos) a conservar
+            intervalo_ms (float): Intervalo entre muestras
+            tasa (float): Fracción de solicitudes a muestrear (0 a 1)
+        """
+        self.directorio = directorio
+        self.umbral = umbral_ms / 1000
+        self.max_perfiles = max_perfiles
+        self.intervalo = intervalo_ms / 1000
+        self.tasa = tasa
+
+        self._activas = {}
+        self._lock = threading.Lock()
+        self._hay_activas = threading.Event()
+        self._hilo = None
+
+        # Heap (duración, base) de los perfiles guardados: el más rápido primero
+        self._peores = []
+        self._cargar_existentes()
+
+    def _cargar_existentes(self):
+        if not os.path.isdir(self.directorio):
+            return
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directorio, nombre), encoding='utf-8') as f:
+                        duracion = json.load(f)['duracion_ms']
+                except (OSError, ValueError, KeyError):
+                    continue
+                heapq.heappush(self._peores, (duracion, nombre[:-len('.json')]))
+
+    def _iniciar_hilo(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(
+                target=self._muestrear, name='perfilador', daemon=True
+            )
+            self._hilo.start()
+
+    def _muestrear(self):
+        """Bucle del hilo de muestreo (espera sin costo si no hay solicitudes)"""
+        while True:
+            self._hay_activas.wait()
+            time.sleep(self.intervalo)
+
+            with self._lock:
+                activas = list(self._activas.items())
+            if not activas:
+                continue
+
+            frames = sys._current_frames()
+            for id_hilo, solicitud in activas:
+                frame = frames.get(id_hilo)
+                if frame is None:
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(
+                        f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}"
+                        f":{codigo.co_firstlineno})".replace(';', ',')
+                    )
+                    frame = frame.f_back
+                solicitud.muestras[';'.join(reversed(pila))] += 1
+
+    def perfilar(self, nombre, funcion, args, kwargs):
+        """
+        Ejecuta una función muestreando su pila
+
+        Args:
+            nombre (str): Nombre de la solicitud en el perfil
+            funcion (callable): Función a ejecutar
+            args (tuple): Argumentos posicionales
+            kwargs (dict): Argumentos con nombre
+
+        Returns:
+            Resultado de la función
+        """
+        id_hilo = threading.get_ident()
+        if id_hilo in self._activas or random.random() >= self.tasa:
+            # Llamada anidada o solicitud no muestreada
+            return funcion(*args, **kwargs)
+
+        solicitud = _Solicitud(nombre)
+        with self._lock:
+            self._activas[id_hilo] = solicitud
+            self._hay_activas.set()
+            self._iniciar_hilo()
+
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            duracion = time.perf_counter() - inicio
+            with self._lock:
+                del self._activas[id_hilo]
+                if not self._activas:
+                    self._hay_activas.clear()
+            if duracion >= self.umbral:
+                self._guardar(solicitud, duracion, args, kwargs)
+
+    def _guardar(self, solicitud, duracion, args, kwargs):
+        """Escribe el perfil y elimina el más rápido si se supera el máximo"""
+        duracion_ms = round(duracion * 1000, 1)
+
+        with self._lock:
+            if len(self._peores) >= self.max_perfiles and duracion_ms <= self._peores[0][0]:
+                return
+
+            os.makedirs(self.directorio, exist_ok=True)
+            base = (f"{datetime.now():%Y%m%d_%H%M%S_%f}_{solicitud.nombre}"
+                    f"_{int(duracion_ms)}ms")
+            ruta = os.path.join(self.directorio, base)
+
+            with open(f"{ruta}.collapsed.txt", 'w', encoding='utf-8') as f:
+                for pila, cantidad in solicitud.muestras.most_common():
+                    f.write(f"{pila} {cantidad}\n")
+
+            with open(f"{ruta}.json", 'w', encoding='utf-8') as f:
+                json.dump({
+                    'funcion': solicitud.nombre,
+                    'duracion_ms': duracion_ms,
+                    'fecha': datetime.now().isoformat(),
+                    'muestras': sum(solicitud.muestras.values()),
+                    'intervalo_ms': self.intervalo * 1000,
+                    'args': [anonimizar(a) for a in args],
+                    'kwargs': {k: anonimizar(v) for k, v in kwargs.items()},
+                }, f, ensure_ascii=False, indent=2)
+
+            heapq.heappush(self._peores, (duracion_ms, base))
+            while len(self._peores) > self.max_perfiles:
+                _, eliminado = heapq.heappop(self._peores)
+                for extension in ('.collapsed.txt', '.json'):
+                    try:
+                        os.remove(os.path.join(self.directorio, eliminado + extension))
+                    except FileNotFoundError:
+                        pass
+
+
+_perfilador = None
+
+
+def configurar(activo=True, **opciones):
+    """
+    Activa o desactiva el perfilador desde código (en lugar de variables de entorno)
+
+    Args:
+        activo (bool): Activar el perfilador
+        **opciones: Argumentos de Perfilador (directorio, umbral_ms, ...)
+
+    Returns:
+        Perfilador o None: Perfilador activo
+    """
+    global _perfilador
+    _perfilador = Perfilador(**opciones) if activo else None
+    return _perfilador
+
+
+def perfilado(nombre):
+    """
+    Decorador: perfila la función si el perfilador está activo
+
+    Args:
+        nombre (str): Nombre de la solicitud en los perfiles
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if _perfilador is None:
+                return funcion(*args, **kwargs)
+            return _perfilador.perfilar(nombre, funcion, args, kwargs)
+        return envoltura
+    return decorador
+
+
+if os.environ.get('CERTIFICADOS_PERFIL', '').lower() in ('1', 'true', 'si', 'sí'):
+    configurar(
+        directorio=os.environ.get('CERTIFICADOS_PERFIL_DIR', 'perfiles'),
+        umbral_ms=_env_float('CERTIFICADOS_PERFIL_UMBRAL_MS', 500),
+        max_perfiles=int(_env_float('CERTIFICADOS_PERFIL_MAX', 20)),
+        intervalo_ms=_env_float('CERTIFICADOS_PERFIL_INTERVALO_MS', 5),
+        tasa=_env_float('CERTIFICADOS_PERFIL_TASA', 1.0),
+    )
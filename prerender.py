@@ -0,0 +1,251 @@
+"""
+Pre-generación de certificados para cohortes de alta demanda
+SLEP Santa Corina
+
+Al inicio del período de matrícula casi todas las solicitudes son de los
+mismos cursos (1° básico, 7° básico, 1° medio). Este proceso genera sus
+certificados fuera de horario, con prioridad baja, y los guarda en un
+almacén en disco. Durante el día la aplicación los entrega desde ahí y
+solo completa el nombre del estudiante.
+
+Los certificados pre-generados NO contienen nombres: se guardan con
+GeneradorCertificado.NOMBRE_PENDIENTE.
+
+Uso (por ejemplo, con cron a las 2:00):
+    python prerender.py --fecha 2026-03-02 --cohortes "1° básico" "7° básico" "1° medio"
+"""
+
+import argparse
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from generador_certificado import GeneradorCertificado
+
+
+COHORTES_POR_DEFECTO = ['1° básico', '7° básico', '1° medio']
+
+
+def normalizar_grado(grado):
+    """
+    Normaliza la glosa de un grado para comparar cohortes
+
+    Args:
+        grado (str): Glosa (ej: "1º Básico")
+
+    Returns:
+        str: Glosa normalizada (ej: "1° básico")
+    """
+    return ' '.join(str(grado).replace('º', '°').lower().split())
+
+
+class AlmacenCertificados:
+    """Certificados pre-generados en disco, con tamaño máximo y expulsión LRU"""
+
+    def __init__(self, directorio, max_mb=500):
+        """
+        Inicializa el almacén
+
+        Args:
+            directorio (str): Carpeta donde se guardan los certificados
+            max_mb (float): Tamaño máximo del almacén. Al superarlo se
+                eliminan los certificados usados hace más tiempo.
+        """
+        self.directorio = directorio
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._archivos = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directorio, exist_ok=True)
+        entradas = []
+        with os.scandir(directorio) as it:
+            for e in it:
+                if e.is_file() and e.name.endswith('.docx'):
+                    stat = e.stat()
+                    entradas.append((stat.st_mtime, e.name, stat.st_size))
+        for _, nombre, tamaño in sorted(entradas):
+            self._archivos[nombre] = tamaño
+            self._total += tamaño
+
+    @staticmethod
+    def clave(run, template_path, fecha_emision, datos):
+        """
+        Clave de un certificado: RUN, template (ruta y versión), fecha de
+        emisión y los datos que se imprimen en él
+
+        Como los datos forman parte de la clave, si el estudiante cambia de
+        curso o establecimiento después de la pre-generación, el certificado
+        guardado deja de coincidir y se genera uno nuevo.
+
+        Args:
+            run (int): RUN sin DV
+            template_path (str): Template usado
+            fecha_emision (date o datetime): Fecha de emisión
+            datos (dict): Datos del certificado (ver
+                GeneradorCertificado.preparar_datos_estudiante); el nombre
+                no se considera
+
+        Returns:
+            str: Nombre de archivo en el almacén
+        """
+        path = os.path.abspath(template_path)
+        version = os.path.getmtime(path) if os.path.exists(path) else 0
+        campos = '|'.join(f"{campo}={datos[campo]}" for campo in sorted(datos) if campo != 'nombre')
+        firma = f"{path}|{version}|{fecha_emision:%Y-%m-%d}|{campos}"
+        resumen = hashlib.sha1(firma.encode('utf-8')).hexdigest()[:16]
+        return f"{int(run)}_{resumen}.docx"
+
+    def obtener(self, clave):
+        """
+        Lee un certificado del almacén
+
+        Args:
+            clave (str): Clave generada con clave()
+
+        Returns:
+            bytes o None: Contenido del certificado, o None si no existe
+        """
+        path = os.path.join(self.directorio, clave)
+        try:
+            with open(path, 'rb') as f:
+                contenido = f.read()
+        except FileNotFoundError:
+            return None
+
+        # Marcar como usado (para la expulsión LRU)
+        os.utime(path)
+        with self._lock:
+            if clave in self._archivos:
+                self._archivos.move_to_end(clave)
+        return contenido
+
+    def guardar(self, clave, contenido):
+        """
+        Guarda un certificado y elimina los menos usados si se supera el máximo
+
+        Args:
+            clave (str): Clave generada con clave()
+            contenido (bytes): Certificado
+        """
+        path = os.path.join(self.directorio, clave)
+        temporal = f"{path}.tmp"
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+        os.replace(temporal, path)
+
+        with self._lock:
+            self._total -= self._archivos.pop(clave, 0)
+            self._archivos[clave] = len(contenido)
+            self._total += len(contenido)
+
+            while self._total > self.max_bytes and len(self._archivos) > 1:
+                antiguo, tamaño = self._archivos.popitem(last=False)
+                self._total -= tamaño
+                try:
+                    os.remove(os.path.join(self.directorio, antiguo))
+                except FileNotFoundError:
+                    pass
+
+    def __contains__(self, clave):
+        return os.path.exists(os.path.join(self.directorio, clave))
+
+    def __len__(self):
+        return len(self._archivos)
+
+
+def prerenderizar(df, registro, almacen, fecha_emision, cohortes=None, pausa=0.0):
+    """
+    Genera los certificados de las cohortes indicadas y los guarda en el almacén
+
+    Args:
+        df (DataFrame): Estudiantes de un año escolar
+        registro (RegistroTemplates): Registro para elegir el template de cada RBD
+        almacen (AlmacenCertificados): Almacén destino
+        fecha_emision (datetime): Fecha de emisión de los certificados
+        cohortes (list, optional): Glosas de COD_GRADO_GLOSA_PRE a incluir
+        pausa (float): Segundos de espera entre certificados (para no
+            competir con la aplicación si se ejecuta en horario de atención)
+
+    Returns:
+        dict: {'generados', 'existentes', 'segundos'}
+    """
+    cohortes = {normalizar_grado(c) for c in (cohortes or COHORTES_POR_DEFECTO)}
+    grados = df['COD_GRADO_GLOSA_PRE'].astype(str).map(normalizar_grado)
+    seleccion = df[grados.isin(cohortes)]
+
+    inicio = time.perf_counter()
+    generados = 0
+    existentes = 0
+
+    for _, estudiante in seleccion.iterrows():
+        template_path = registro.resolver(
+            rbd=estudiante['RBD_PRE'],
+            comuna=estudiante['NOM_COM_RBD']
+        )
+        datos = GeneradorCertificado.preparar_datos_estudiante(estudiante)
+        datos['nombre'] = GeneradorCertificado.NOMBRE_PENDIENTE
+
+        clave = almacen.clave(estudiante['SAL_RUN'], template_path, fecha_emision, datos)
+        if clave in almacen:
+            existentes += 1
+            continue
+
+        generador = GeneradorCertificado(template_path, cache=registro.cache, determinista=True)
+        buffer = generador.generar_certificado(datos, fecha_emision=fecha_emision)
+        almacen.guardar(clave, buffer.getvalue())
+        generados += 1
+
+        if pausa:
+            time.sleep(pausa)
+
+    return {
+        'generados': generados,
+        'existentes': existentes,
+        'segundos': time.perf_counter() - inicio,
+    }
+
+
+def main():
+    """Punto de entrada por línea de comandos"""
+    from base_datos import BaseDatosPorAnio, preparar_particiones
+    from registro_templates import RegistroTemplates
+
+    parser = argparse.ArgumentParser(description="Pre-generación de certificados por cohorte")
+    parser.add_argument('--fecha', required=True, help="Fecha de emisión (AAAA-MM-DD)")
+    parser.add_argument('--cohortes', nargs='+', default=COHORTES_POR_DEFECTO,
+                        help="Glosas de grado a incluir (por defecto: 1° básico, 7° básico, 1° medio)")
+    parser.add_argument('--anio', type=int, default=None,
+                        help="Año escolar (por defecto, el más reciente)")
+    parser.add_argument('--destino', default='certificados_prerender',
+                        help="Carpeta del almacén (por defecto: certificados_prerender)")
+    parser.add_argument('--max-mb', type=float, default=500,
+                        help="Tamaño máximo del almacén en MB (por defecto: 500)")
+    parser.add_argument('--pausa', type=float, default=0.0,
+                        help="Segundos de espera entre certificados")
+    args = parser.parse_args()
+
+    # Prioridad baja para no afectar a la aplicación
+    if hasattr(os, 'nice'):
+        os.nice(19)
+
+    fecha = datetime.strptime(args.fecha, '%Y-%m-%d')
+
+    preparar_particiones('datos_prematricula.xlsx', 'datos_por_anio')
+    base_datos = BaseDatosPorAnio('datos_por_anio')
+    df = base_datos.particion(args.anio).datos
+
+    registro = RegistroTemplates('templates', 'template_certificado.docx')
+    almacen = AlmacenCertificados(args.destino, max_mb=args.max_mb)
+
+    resultado = prerenderizar(df, registro, almacen, fecha, args.cohortes, args.pausa)
+    print(f"✓ {resultado['generados']:,} certificados generados, "
+          f"{resultado['existentes']:,} ya existían ({resultado['segundos']:.1f} s)")
+    print(f"   Almacén: {args.destino} ({len(almacen):,} certificados)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+"""
+Prueba de carga de la aplicación
+SLEP Santa Corina
+
+Simula varias secretarias usando app.py al mismo tiempo, con el AppTest de
+Streamlit (la aplicación real, sin navegador). Cada sesión repite el flujo
+completo: buscar RUN → ingresar nombre → generar → descargar, sobre una
+base de prematrícula sintética.
+
+Para cada cantidad de sesiones simultáneas se reporta el rendimiento
+(flujos por segundo), la latencia (p50/p95/p99), el uso de CPU y la
+memoria. Los resultados se agregan a un CSV para comparar la curva de
+saturación entre versiones.
+
+Uso:
+    python prueba_carga.py --sesiones 1 2 4 8 16 --flujos 5 --etiqueta v1.3
+"""
+
+import argparse
+import csv
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from openpyxl import Workbook
+
+from utils import formatear_run
+
+
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(DIRECTORIO_APP, 'app.py')
+TEMPLATE_PATH = os.path.join(DIRECTORIO_APP, 'template_certificado.docx')
+
+PASOS = ('carga', 'busqueda', 'generacion', 'descarga')
+
+# Versión de Streamlit con la que se probó runtime_compartido (usa detalles
+# internos de AppTest; ver verificar_streamlit)
+VERSION_STREAMLIT_PROBADA = '1.66'
+
+_COMUNAS = ['MAIPÚ', 'CERRILLOS', 'ESTACIÓN CENTRAL']
+_GRADOS = ['1° básico', '2° básico', '3° básico', '4° básico', '5° básico', '6° básico',
+           '7° básico', '8° básico', '1° medio', '2° medio', '3° medio', '4° medio']
+
+
+def generar_roster_sintetico(path, estudiantes, anio=2026, establecimientos=40, semilla=0):
+    """
+    Genera un Excel de prematrícula con datos ficticios
+
+    Args:
+        path (str): Ruta del Excel a crear
+        estudiantes (int): Cantidad de estudiantes
+        anio (int): Año escolar
+        establecimientos (int): Cantidad de establecimientos
+        semilla (int): Semilla para reproducir los mismos datos
+
+    Returns:
+        list: RUN (sin DV) generados
+    """
+    azar = random.Random(semilla)
+    runs = azar.sample(range(20_000_000, 27_000_000), estudiantes)
+
+    wb = Workbook(write_only=True)
+    hoja = wb.create_sheet('Sheet 1')
+    hoja.append(['ANO_ESCOLAR', 'NOM_COM_RBD', 'RBD_PRE', 'NOM_RBD', 'SAL_RUN',
+                 'LET_CUR_PRE', 'COD_GRADO_GLOSA_PRE'])
+    for run in runs:
+        rbd = 10000 + azar.randrange(establecimientos)
+        hoja.append([
+            anio,
+            _COMUNAS[rbd % len(_COMUNAS)],
+            rbd,
+            f"ESCUELA DE PRUEBA NUMERO {rbd}",
+            run,
+            azar.choice('ABCD'),
+            azar.choice(_GRADOS),
+        ])
+    wb.save(path)
+    return runs
+
+
+def _rss_mb():
+    """Memoria residente actual del proceso en MB (o el máximo si no está disponible)"""
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def verificar_streamlit():
+    """
+    Verifica que Streamlit tenga los detalles internos que usa runtime_compartido
+
+    Avisa si la versión instalada no es la probada y falla si falta alguno
+    de los atributos, para no reportar resultados incorrectos.
+
+    Raises:
+        RuntimeError: Si la versión de Streamlit no es compatible
+    """
+    import inspect
+
+    import streamlit
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+    from streamlit.testing.v1 import app_test
+
+    version = '.'.join(streamlit.__version__.split('.')[:2])
+    if version != VERSION_STREAMLIT_PROBADA:
+        print(f"⚠️ Streamlit {streamlit.__version__}: la prueba de carga se probó con "
+              f"{VERSION_STREAMLIT_PROBADA}")
+
+    codigo_runner = inspect.getsource(ScriptRunner.__init__)
+    faltantes = [
+        nombre for nombre, presente in [
+            ('app_test.Runtime', getattr(app_test, 'Runtime', None) is Runtime),
+            ('app_test.LocalScriptRunner', hasattr(app_test, 'LocalScriptRunner')),
+            ('Runtime._instance', hasattr(Runtime, '_instance')),
+            ('ScriptRunner._session_id', 'self._session_id' in codigo_runner),
+            ('ScriptRunner._script_cache', 'self._script_cache' in codigo_runner),
+            ('MediaFileManager._storage',
+             hasattr(MediaFileManager(MemoryMediaFileStorage("/mock/media")), '_storage')),
+        ] if not presente
+    ]
+    if faltantes:
+        raise RuntimeError(
+            f"Streamlit {streamlit.__version__} no es compatible con la prueba de carga "
+            f"(probada con {VERSION_STREAMLIT_PROBADA}); faltan: {', '.join(faltantes)}"
+        )
+
+
+@contextmanager
+def runtime_compartido():
+    """
+    Un único runtime de Streamlit para todas las sesiones simuladas
+
+    AppTest crea un runtime de prueba en cada ejecución y lo elimina al
+    terminar, y todas sus sesiones usan el mismo id, lo que solo funciona
+    con una sesión a la vez. Igual que en el servidor real, aquí todas las
+    sesiones comparten el runtime (con el administrador de archivos de
+    descarga) y el script compilado, y cada sesión tiene su propio id.
+
+    Yields:
+        Runtime: Runtime compartido
+    """
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test
+    from streamlit.testing.v1.util import patch_config_options
+
+    verificar_streamlit()
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+
+    script_cache = ScriptCache()
+    runner_original = app_test.LocalScriptRunner
+
+    class ScriptRunnerSesion(runner_original):
+        def __init__(self, script_path, session_state, *args, **kwargs):
+            super().__init__(script_path, session_state, *args, **kwargs)
+            self._session_id = f"sesion-{id(session_state)}"
+            self._script_cache = script_cache
+
+    # AppTest asigna su runtime de prueba a esta subclase y no al runtime global
+    runtime_original = app_test.Runtime
+    app_test.Runtime = type('RuntimeSesion', (Runtime,), {})
+    app_test.LocalScriptRunner = ScriptRunnerSesion
+    Runtime._instance = runtime
+    try:
+        with patch_config_options({"global.appTest": True}):
+            yield runtime
+    finally:
+        app_test.Runtime = runtime_original
+        app_test.LocalScriptRunner = runner_original
+        Runtime._instance = None
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicion = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[posicion]
+
+
+def _boton(at, etiqueta):
+    return next(b for b in at.button if b.label == etiqueta)
+
+
+def _verificar(at, paso):
+    if at.exception:
+        raise RuntimeError(f"{paso}: {at.exception[0].value}")
+    if at.error:
+        raise RuntimeError(f"{paso}: {at.error[0].value}")
+
+
+class Sesion:
+    """Una secretaria usando la aplicación (una sesión de Streamlit)"""
+
+    def __init__(self, timeout=120):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.cargada = False
+
+    def abrir(self):
+        """Carga la página. Returns: segundos"""
+        inicio = time.perf_counter()
+        self.at.run()
+        _verificar(self.at, 'carga')
+        self.cargada = True
+        return time.perf_counter() - inicio
+
+    @staticmethod
+    def descargar(url):
+        """Contenido del archivo publicado en una URL de descarga"""
+        from streamlit.runtime import Runtime
+        almacen = Runtime.instance().media_file_mgr._storage
+        return almacen.get_file(url.rsplit('/', 1)[-1]).content
+
+    def flujo(self, run, nombre):
+        """
+        Busca un estudiante, genera y descarga su certificado
+
+        Returns:
+            dict: Segundos de cada paso
+        """
+        tiempos = {'carga': self.abrir() if not self.cargada else 0.0}
+        at = self.at
+
+        inicio = time.perf_counter()
+        at.text_input[0].input(formatear_run(run))
+        _boton(at, "🔎 Buscar").click().run()
+        _verificar(at, 'búsqueda')
+        tiempos['busqueda'] = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        at.text_input(key='nombre_estudiante').input(nombre)
+        _boton(at, "📄 Generar Certificado").click().run()
+        _verificar(at, 'generación')
+        tiempos['generacion'] = time.perf_counter() - inicio
+
+        # Descarga: el archivo que entrega la URL del botón de descarga
+        inicio = time.perf_counter()
+        if not at.get('download_button'):
+            raise RuntimeError("descarga: no se mostró el botón de descarga")
+        if at.session_state['nombre_archivo'] != f"Certificado_{run}.docx":
+            raise RuntimeError("descarga: el certificado no corresponde al RUN buscado")
+        contenido = self.descargar(at.get('download_button')[0].proto.url)
+        if not contenido.startswith(b'PK'):
+            raise RuntimeError("descarga: el archivo no es un .docx")
+        tiempos['descarga'] = time.perf_counter() - inicio
+
+        tiempos['total'] = sum(tiempos[p] for p in PASOS)
+        return tiempos
+
+
+def medir_nivel(runs, sesiones, flujos_por_sesion, semilla=0):
+    """
+    Ejecuta sesiones simultáneas y mide el rendimiento
+
+    Args:
+        runs (list): RUN existentes en la base sintética
+        sesiones (int): Cantidad de sesiones simultáneas
+        flujos_por_sesion (int): Flujos completos que hace cada sesión
+        semilla (int): Semilla para elegir los RUN
+
+    Returns:
+        dict: Métricas del nivel de carga
+    """
+    azar = random.Random(semilla + sesiones)
+    mediciones = []
+    errores = []
+    lock = threading.Lock()
+    barrera = threading.Barrier(sesiones)
+
+    def trabajar(numero):
+        sesion = Sesion()
+        barrera.wait()
+        for i in range(flujos_por_sesion):
+            run = azar.choice(runs)
+            try:
+                tiempos = sesion.flujo(run, f"ESTUDIANTE PRUEBA {numero} {i}")
+            except Exception as e:
+                with lock:
+                    errores.append(str(e))
+                continue
+            with lock:
+                mediciones.append(tiempos)
+
+    rss_inicio = _rss_mb()
+    cpu_inicio = time.process_time()
+    inicio = time.perf_counter()
+
+    hilos = [threading.Thread(target=trabajar, args=(n,)) for n in range(sesiones)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    segundos = time.perf_counter() - inicio
+    cpu = time.process_time() - cpu_inicio
+    rss_fin = _rss_mb()
+
+    totales = [m['total'] for m in mediciones]
+    resultado = {
+        'sesiones': sesiones,
+        'flujos': len(mediciones),
+        'errores': len(errores),
+        'segundos': round(segundos, 2),
+        'flujos_por_seg': round(len(mediciones) / segundos, 2) if segundos else 0.0,
+        'p50_ms': round(percentil(totales, 50) * 1000, 1),
+        'p95_ms': round(percentil(totales, 95) * 1000, 1),
+        'p99_ms': round(percentil(totales, 99) * 1000, 1),
+        'cpu_pct': round(cpu / segundos * 100, 1) if segundos else 0.0,
+        'rss_mb': round(rss_fin, 1),
+        'rss_por_sesion_mb': round(max(0.0, rss_fin - rss_inicio) / sesiones, 2),
+    }
+    for paso in PASOS[1:]:
+        resultado[f"{paso}_p95_ms"] = round(percentil([m[paso] for m in mediciones], 95) * 1000, 1)
+    resultado['detalle_errores'] = errores[:5]
+    return resultado
+
+
+def ejecutar_prueba(niveles, flujos_por_sesion=5, estudiantes=20000, semilla=0):
+    """
+    Prepara una base sintética y mide cada nivel de sesiones simultáneas
+
+    La aplicación se ejecuta en un directorio temporal con el Excel
+    sintético y una copia del template, para no tocar los datos reales.
+
+    Args:
+        niveles (list): Cantidades de sesiones simultáneas a probar
+        flujos_por_sesion (int): Flujos completos por sesión
+        estudiantes (int): Tamaño de la base sintética
+        semilla (int): Semilla de los datos y de la elección de RUN
+
+    Returns:
+        list: Métricas de cada nivel (ver medir_nivel)
+    """
+    directorio = tempfile.mkdtemp(prefix='prueba_carga_')
+    directorio_original = os.getcwd()
+    try:
+        runs = generar_roster_sintetico(
+            os.path.join(directorio, 'datos_prematricula.xlsx'), estudiantes, semilla=semilla
+        )
+        shutil.copy(TEMPLATE_PATH, os.path.join(directorio, 'template_certificado.docx'))
+        os.chdir(directorio)
+
+        with runtime_compartido() as runtime:
+            # Calentamiento: particiones, caches y primera importación de módulos
+            Sesion().flujo(runs[0], "CALENTAMIENTO")
+
+            from streamlit.runtime import Runtime
+            if Runtime._instance is not runtime:
+                raise RuntimeError(
+                    "AppTest reemplazó el runtime compartido: la versión de Streamlit "
+                    f"no es compatible (probada con {VERSION_STREAMLIT_PROBADA})"
+                )
+            return [medir_nivel(runs, n, flujos_por_sesion, semilla) for n in niveles]
+    finally:
+        os.chdir(directorio_original)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+COLUMNAS_CSV = [
+    'fecha', 'etiqueta', 'sesiones', 'flujos', 'errores', 'segundos', 'flujos_por_seg',
+    'p50_ms', 'p95_ms', 'p99_ms', 'busqueda_p95_ms', 'generacion_p95_ms',
+    'descarga_p95_ms', 'cpu_pct', 'rss_mb', 'rss_por_sesion_mb',
+]
+
+
+def guardar_csv(resultados, path, etiqueta):
+    """Agrega los resultados al CSV de seguimiento (lo crea si no existe)"""
+    nuevo = not os.path.exists(path)
+    fecha = datetime.now().isoformat(timespec='seconds')
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        escritor = csv.DictWriter(f, fieldnames=COLUMNAS_CSV, extrasaction='ignore')
+        if nuevo:
+            escritor.writeheader()
+        for r in resultados:
+            escritor.writerow(dict(r, fecha=fecha, etiqueta=etiqueta))
+
+
+def imprimir_resultados(resultados):
+    """Muestra la tabla de resultados y la curva de saturación"""
+    print(f"\n{'SESIONES':>8} {'FLUJOS/S':>9} {'P50 MS':>8} {'P95 MS':>8} {'P99 MS':>8} "
+          f"{'BÚSQ P95':>9} {'GEN P95':>8} {'CPU %':>6} {'RSS MB':>7} {'MB/SES':>7} {'ERR':>4}")
+    print("-" * 96)
+    for r in resultados:
+        print(f"{r['sesiones']:>8} {r['flujos_por_seg']:>9.2f} {r['p50_ms']:>8.0f} "
+              f"{r['p95_ms']:>8.0f} {r['p99_ms']:>8.0f} {r['busqueda_p95_ms']:>9.0f} "
+              f"{r['generacion_p95_ms']:>8.0f} {r['cpu_pct']:>6.0f} {r['rss_mb']:>7.0f} "
+              f"{r['rss_por_sesion_mb']:>7.2f} {r['errores']:>4}")
+        for error in r['detalle_errores']:
+            print(f"   ✗ {error}")
+
+    maximo = max((r['flujos_por_seg'] for r in resultados), default=0) or 1
+    print("\nCurva de saturación (flujos por segundo):")
+    for r in resultados:
+        barra = '█' * int(round(r['flujos_por_seg'] / maximo * 40))
+        print(f"{r['sesiones']:>5} sesiones | {barra} {r['flujos_por_seg']:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la aplicación")
+    parser.add_argument('--sesiones', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help="Sesiones simultáneas a probar (por defecto: 1 2 4 8 16)")
+    parser.add_argument('--flujos', type=int, default=5,
+                        help="Flujos completos por sesión (por defecto: 5)")
+    parser.add_argument('--estudiantes', type=int, default=20000,
+                        help="Tamaño de la base sintética (por defecto: 20000)")
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default='prueba_carga.csv',
+                        help="CSV donde se agregan los resultados (por defecto: prueba_carga.csv)")
+    parser.add_argument('--etiqueta', default='',
+                        help="Versión o descripción de la corrida (ej: v1.3)")
+    args = parser.parse_args()
+
+    # Las sesiones se crean fuera de un servidor; el aviso no aplica
+    # (Streamlit reconfigura el nivel de sus loggers, por eso se usa un filtro)
+    logging.getLogger('streamlit.runtime.scriptrunner_utils.script_run_context').addFilter(
+        lambda registro: 'ScriptRunContext' not in registro.getMessage()
+    )
+
+    print(f"Base sintética: {args.estudiantes:,} estudiantes | "
+          f"{args.flujos} flujos por sesión | niveles: {args.sesiones}")
+
+    resultados = ejecutar_prueba(args.sesiones, args.flujos, args.estudiantes, args.semilla)
+    imprimir_resultados(resultados)
+    guardar_csv(resultados, args.salida, args.etiqueta)
+    print(f"\n✓ Resultados agregados a {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Registro de templates de certificados
+SLEP Santa Corina
+
+Permite que cada establecimiento (o comuna) tenga su propio membrete.
+Los templates se buscan en un directorio con la siguiente convención:
+
+    templates/
+    ├── rbd_9877.docx          # Template para el RBD 9877
+    ├── comuna_maipu.docx      # Template para todos los RBD de Maipú
+    └── ...
+
+Si no existe un template específico se usa el template por defecto.
+Cada template se lee y se compila una sola vez en un cache compartido.
+"""
+
+import copy
+import io
+import os
+import re
+import threading
+import time
+import unicodedata
+import zipfile
+from collections import OrderedDict
+
+from docx import Document
+from docx.document import Document as DocumentoDocx
+from docx.opc.oxml import serialize_part_xml
+
+
+def normalizar_clave(texto):
+    """
+    Normaliza un nombre (ej: comuna) para usarlo como clave de template
+
+    Args:
+        texto (str): Texto a normalizar (ej: "MAIPÚ")
+
+    Returns:
+        str: Texto sin tildes, en minúsculas y con '_' (ej: "maipu")
+    """
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+
+
+class TemplateCompilado:
+    """Template leído y analizado una vez, listo para cada certificado"""
+
+    def __init__(self, path):
+        """
+        Lee y analiza el template, y precalcula los párrafos con texto
+
+        Args:
+            path (str): Ruta al archivo .docx template
+        """
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            contenido = f.read()
+
+        documento = Document(io.BytesIO(contenido))
+
+        # Índices de párrafos con texto: el resto nunca tiene placeholders
+        self.indices_parrafos = [
+            i for i, para in enumerate(documento.paragraphs)
+            if para.text.strip()
+        ]
+        self.tiene_tablas = len(documento.tables) > 0
+
+        # Solo word/document.xml cambia en cada certificado: se conserva su
+        # árbol ya analizado y el resto del paquete tal como lo guarda python-docx
+        self.parte = documento.part
+        self.elemento = documento.element
+        self.nombre_parte = documento.part.partname.lstrip('/')
+        buffer = io.BytesIO()
+        documento.save(buffer)
+        with zipfile.ZipFile(buffer) as paquete:
+            self.partes = {info.filename: paquete.read(info) for info in paquete.infolist()}
+
+    def nuevo_documento(self):
+        """
+        Retorna un documento nuevo copiando el árbol ya analizado, sin leer
+        el disco ni volver a abrir el paquete
+
+        Returns:
+            DocumentoCompilado: Documento listo para modificar
+        """
+        return DocumentoCompilado(self, copy.deepcopy(self.elemento))
+
+
+class DocumentoCompilado:
+    """Copia de un TemplateCompilado: párrafos y tablas de python-docx, y save()"""
+
+    def __init__(self, template, elemento):
+        self.template = template
+        self.element = elemento
+        # Las partes compartidas (estilos, numeración) solo se leen
+        self._documento = DocumentoDocx(elemento, template.parte)
+
+    @property
+    def paragraphs(self):
+        return self._documento.paragraphs
+
+    @property
+    def tables(self):
+        return self._documento.tables
+
+    def entradas(self):
+        """
+        Contenido del paquete sin comprimir
+
+        Returns:
+            dict: {nombre de la entrada en el ZIP: bytes}
+        """
+        partes = dict(self.template.partes)
+        partes[self.template.nombre_parte] = serialize_part_xml(self.element)
+        return partes
+
+    def save(self, destino):
+        """
+        Guarda el documento (mismo contenido que Document.save de python-docx)
+
+        Args:
+            destino (str o archivo): Ruta o stream de destino
+        """
+        with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as paquete:
+            for nombre, contenido in self.entradas().items():
+                paquete.writestr(nombre, contenido)
+
+
+class CacheTemplates:
+    """Cache LRU de templates compilados, compartido entre sesiones"""
+
+    def __init__(self, max_templates=64):
+        """
+        Inicializa el cache
+
+        Args:
+            max_templates (int): Cantidad máxima de templates en memoria
+        """
+        self.max_templates = max_templates
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, path):
+        """
+        Obtiene el template compilado, parseándolo solo si no está en cache
+        o si el archivo cambió en disco
+
+        Args:
+            path (str): Ruta al archivo .docx template
+
+        Returns:
+            TemplateCompilado: Template compilado
+        """
+        path = os.path.abspath(path)
+        mtime = os.path.getmtime(path)
+
+        with self._lock:
+            template = self._templates.get(path)
+            if template is not None and template.mtime == mtime:
+                self._templates.move_to_end(path)
+                return template
+
+        # Parsear fuera del lock para no bloquear a otras sesiones
+        template = TemplateCompilado(path)
+
+        with self._lock:
+            self._templates[path] = template
+            self._templates.move_to_end(path)
+            while len(self._templates) > self.max_templates:
+                self._templates.popitem(last=False)
+
+        return template
+
+    def invalidar(self, path=None):
+        """
+        Elimina un template del cache (o todos si no se indica ruta)
+
+        Args:
+            path (str, optional): Ruta del template a eliminar
+        """
+        with self._lock:
+            if path is None:
+                self._templates.clear()
+            else:
+                self._templates.pop(os.path.abspath(path), None)
+
+    def __len__(self):
+        return len(self._templates)
+
+    def __contains__(self, path):
+        return os.path.abspath(path) in self._templates
+
+
+class RegistroTemplates:
+    """Resuelve qué template usar para cada establecimiento"""
+
+    def __init__(self, directorio, template_defecto, max_templates=64,
+                 intervalo_revision=5.0):
+        """
+        Inicializa el registro
+
+        Args:
+            directorio (str): Carpeta con templates rbd_<RBD>.docx y comuna_<nombre>.docx
+            template_defecto (str): Template a usar si no hay uno específico
+            max_templates (int): Tamaño máximo del cache de templates
+            intervalo_revision (float): Segundos entre revisiones del directorio
+        """
+        self.directorio = directorio
+        self.template_defecto = template_defecto
+        self.intervalo_revision = intervalo_revision
+        self.cache = CacheTemplates(max_templates)
+
+        self._por_rbd = {}
+        self._por_comuna = {}
+        self._firma = None
+        self._ultima_revision = 0.0
+        self._lock = threading.Lock()
+
+        self.revisar_directorio(forzar=True)
+
+    def _firma_directorio(self):
+        """Firma del directorio: nombres y mtimes de los .docx"""
+        if not os.path.isdir(self.directorio):
+            return ()
+        with os.scandir(self.directorio) as entradas:
+            return tuple(sorted(
+                (e.name, e.stat().st_mtime)
+                for e in entradas
+                if e.is_file() and e.name.lower().endswith('.docx')
+            ))
+
+    def revisar_directorio(self, forzar=False):
+        """
+        Relee el directorio de templates si cambió desde la última revisión
+
+        Args:
+            forzar (bool): Revisar aunque no haya pasado el intervalo
+
+        Returns:
+            bool: True si el registro se actualizó
+        """
+        ahora = time.monotonic()
+        if not forzar and ahora - self._ultima_revision < self.intervalo_revision:
+            return False
+
+        with self._lock:
+            self._ultima_revision = ahora
+            firma = self._firma_directorio()
+            if firma == self._firma:
+                return False
+
+            por_rbd = {}
+            por_comuna = {}
+            for nombre, _ in firma:
+                base = os.path.splitext(nombre)[0]
+                path = os.path.join(self.directorio, nombre)
+                if base.lower().startswith('rbd_'):
+                    por_rbd[base[4:].strip()] = path
+                elif base.lower().startswith('comuna_'):
+                    por_comuna[normalizar_clave(base[7:])] = path
+
+            # Templates modificados o eliminados salen del cache
+            anteriores = dict(self._firma or ())
+            actuales = dict(firma)
+            for nombre, mtime in anteriores.items():
+                if actuales.get(nombre) != mtime:
+                    self.cache.invalidar(os.path.join(self.directorio, nombre))
+
+            self._por_rbd = por_rbd
+            self._por_comuna = por_comuna
+            self._firma = firma
+            return True
+
+    def resolver(self, rbd=None, comuna=None):
+        """
+        Indica qué template corresponde a un establecimiento
+
+        Prioridad: template del RBD, luego de la comuna, luego el por defecto.
+
+        Args:
+            rbd (int o str, optional): Código RBD del establecimiento
+            comuna (str, optional): Nombre de la comuna
+
+        Returns:
+            str: Ruta al template a usar
+        """
+        self.revisar_directorio()
+
+        if rbd is not None:
+            path = self._por_rbd.get(str(rbd).strip())
+            if path:
+                return path
+
+        if comuna:
+            path = self._por_comuna.get(normalizar_clave(comuna))
+            if path:
+                return path
+
+        return self.template_defecto
+
+    def templates_registrados(self):
+        """
+        Lista los templates específicos disponibles
+
+        Returns:
+            dict: {'rbd': {rbd: ruta}, 'comuna': {comuna: ruta}}
+        """
+        self.revisar_directorio()
+        return {'rbd': dict(self._por_rbd), 'comuna': dict(self._por_comuna)}
@@ -4,9 +4,25 @@ Prueba las funciones principales sin necesidad de ejecutar Streamlit
 """
 
 import pandas as pd
-from utils import formatear_run, validar_run, limpiar_run, calcular_dv
+from utils import formatear_run, validar_run, limpiar_run, calcular_dv, interpretar_run
 from generador_certificado import GeneradorCertificado
+from registro_templates import RegistroTemplates
+from base_datos import BaseDatosPorAnio, guardar_particiones
+from ingesta import ingerir, normalizar_columna, cargar_compacto
+from openpyxl import Workbook
+from prerender import AlmacenCertificados, prerenderizar
+from docx import Document
+import hashlib
+import io
+import json
+import time
+from perfilador import Perfilador, anonimizar
+from generador_certificado import calcular_etag
+from prueba_carga import ejecutar_prueba, percentil
 from datetime import datetime
+import os
+import shutil
+import tempfile
 
 
 def test_utils():
@@ -40,6 +56,38 @@ def test_utils():
     for run in test_runs_completos:
         run_limpio = limpiar_run(run)
         print(f"   {run} → {run_limpio}")
+    
+    # Test 5: DV con tablas precalculadas vs. cálculo dígito a dígito
+    print("\n5. Comparando DV precalculado:")
+    def dv_referencia(run):
+        suma, multiplicador = 0, 2
+        while run > 0:
+            suma += (run % 10) * multiplicador
+            run //= 10
+            multiplicador = 2 if multiplicador == 7 else multiplicador + 1
+        return {11: '0', 10: 'K'}.get(11 - suma % 11, str(11 - suma % 11))
+    muestra = list(range(0, 20000)) + list(range(99990000, 100010000, 7))
+    assert all(calcular_dv(run) == dv_referencia(run) for run in muestra)
+    print(f"   ✓ {len(muestra):,} RUNs coinciden")
+    assert calcular_dv(-5) == calcular_dv('5')
+    assert calcular_dv(True) is None
+    
+    # Test 6: Interpretar RUN usando el DV
+    print("\n6. Interpretando RUNs:")
+    casos = {
+        "12.345.678-5": ([12345678], []),
+        "123456785": ([12345678], [123456785, 1234567]),
+        "100757260": ([100757260], [10075726, 1007572]),
+        "12345674": ([1234567, 12345674], []),
+        "123456780": ([123456780], [12345678, 1234567]),
+        "12345678": ([12345678], [1234567]),
+        "12345678-0": ([12345678], []),
+        "1234567-K": ([1234567], []),
+    }
+    for run, esperado in casos.items():
+        resultado = interpretar_run(run)
+        print(f"   {run} → consultar {resultado[0]}, alternativas {resultado[1]}")
+        assert resultado == esperado
 
 
 def test_busqueda():
@@ -132,6 +180,352 @@ def test_generacion_certificado():
         traceback.print_exc()
 
 
+def test_registro_templates():
+    """Prueba la selección de templates por RBD y comuna"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE REGISTRO DE TEMPLATES")
+    print("="*80)
+    
+    directorio = tempfile.mkdtemp()
+    try:
+        shutil.copy('template_certificado.docx', os.path.join(directorio, 'rbd_9877.docx'))
+        shutil.copy('template_certificado.docx', os.path.join(directorio, 'comuna_maipu.docx'))
+        
+        registro = RegistroTemplates(directorio, 'template_certificado.docx', max_templates=2)
+        
+        print("\n1. Resolviendo templates:")
+        casos = [(9877, 'MAIPÚ', 'rbd_9877.docx'),
+                 (1234, 'MAIPÚ', 'comuna_maipu.docx'),
+                 (1234, 'PUDAHUEL', 'template_certificado.docx')]
+        for rbd, comuna, esperado in casos:
+            path = registro.resolver(rbd=rbd, comuna=comuna)
+            print(f"   RBD {rbd} / {comuna} → {os.path.basename(path)}")
+            assert os.path.basename(path) == esperado
+        
+        print("\n2. Generando con cache compartido:")
+        datos = {'nombre': 'ESTUDIANTE DE PRUEBA', 'run': '22.218.556-3', 'rbd': 9877}
+        for rbd in (9877, 9877, 1234):
+            path = registro.resolver(rbd=rbd, comuna='MAIPÚ')
+            generador = GeneradorCertificado(path, cache=registro.cache)
+            buffer = generador.generar_certificado(datos, fecha_emision=datetime(2026, 1, 20))
+            assert generador.template_usado == path
+            assert len(buffer.getvalue()) > 0
+        print(f"   ✓ Templates en cache: {len(registro.cache)}")
+        assert len(registro.cache) == 2
+        
+        # El template compilado produce el mismo documento que leerlo del disco
+        fecha = datetime(2026, 1, 20)
+        con_cache = GeneradorCertificado(path, cache=registro.cache, determinista=True)
+        sin_cache = GeneradorCertificado(path, determinista=True)
+        assert (con_cache.generar_certificado(datos, fecha).getvalue()
+                == sin_cache.generar_certificado(datos, fecha).getvalue())
+        
+        print("\n3. Detectando templates nuevos:")
+        shutil.copy('template_certificado.docx', os.path.join(directorio, 'rbd_1234.docx'))
+        registro.revisar_directorio(forzar=True)
+        path = registro.resolver(rbd=1234, comuna='MAIPÚ')
+        print(f"   RBD 1234 → {os.path.basename(path)}")
+        assert os.path.basename(path) == 'rbd_1234.docx'
+        
+        print("\n4. Expulsión LRU:")
+        GeneradorCertificado('template_certificado.docx', cache=registro.cache).generar_certificado(datos)
+        print(f"   ✓ Templates en cache: {len(registro.cache)} (máximo {registro.cache.max_templates})")
+        assert len(registro.cache) == 2
+    finally:
+        shutil.rmtree(directorio)
+
+
+def test_base_datos_por_anio():
+    """Prueba la base de datos particionada por año escolar"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE BASE DE DATOS POR AÑO")
+    print("="*80)
+    
+    directorio = tempfile.mkdtemp()
+    try:
+        df = pd.DataFrame({
+            'ANO_ESCOLAR': [2025, 2025, 2026, 2026],
+            'SAL_RUN': [12345678, 22218556, 12345678, 19560438],
+            'NOM_RBD': ['ESCUELA A', 'ESCUELA B', 'ESCUELA C', 'ESCUELA D'],
+        })
+        
+        print("\n1. Guardando particiones:")
+        anios = guardar_particiones(df, directorio)
+        print(f"   ✓ Años: {anios}")
+        assert anios == [2025, 2026]
+        
+        base = BaseDatosPorAnio(directorio)
+        
+        print("\n2. Buscando por año:")
+        assert base.buscar(12345678)['NOM_RBD'] == 'ESCUELA C'
+        assert base.anios_cargados() == [2026]
+        assert base.buscar(12345678, 2025)['NOM_RBD'] == 'ESCUELA A'
+        assert base.buscar(22218556, 2026) is None
+        assert base.buscar(12345678, 2024) is None
+        print(f"   ✓ Años cargados: {base.anios_cargados()}")
+        
+        print("\n3. Recargando una partición actualizada:")
+        guardar_particiones(df.assign(NOM_RBD=['ESCUELA A', 'ESCUELA B', 'ESCUELA E', 'ESCUELA D']), directorio)
+        path = os.path.join(directorio, 'anio_2026.pkl')
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        assert base.buscar(12345678)['NOM_RBD'] == 'ESCUELA E'
+        assert not any(nombre.endswith('.tmp') for nombre in os.listdir(directorio))
+        print("   ✓ Datos nuevos sin reiniciar")
+        
+        print("\n4. Liberando años poco usados:")
+        base_limitada = BaseDatosPorAnio(directorio, max_memoria_mb=0)
+        base_limitada.buscar(12345678, 2025)
+        base_limitada.buscar(12345678, 2026)
+        print(f"   ✓ Años cargados: {base_limitada.anios_cargados()}")
+        assert base_limitada.anios_cargados() == [2026]
+    finally:
+        shutil.rmtree(directorio)
+
+
+def test_ingesta():
+    """Prueba la ingesta de varios Excel con varias hojas"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE INGESTA")
+    print("="*80)
+    
+    directorio = tempfile.mkdtemp()
+    try:
+        encabezado = ['ANO_ESCOLAR', 'NOM_COM_RBD', 'RBD_PRE', 'NOM_RBD',
+                      'SAL_RUN', 'LET_CUR_PRE', 'COD_GRADO_GLOSA_PRE', 'OTRA']
+        
+        wb = Workbook()
+        wb.active.title = 'Maipu'
+        wb.active.append(encabezado)
+        wb.active.append([2026, 'MAIPÚ', 9877, 'ESCUELA A', 12345678, 'A', '1° básico', 'x'])
+        wb.active.append([2026, 'MAIPÚ', 9877, 'ESCUELA A', 22218556, 'B', '7° básico', 'x'])
+        hoja = wb.create_sheet('Notas')
+        hoja.append(['Sin datos'])
+        wb.save(os.path.join(directorio, 'a_maipu.xlsx'))
+        
+        # Encabezados alternativos y un RUN repetido
+        wb = Workbook()
+        wb.active.append(['Año Escolar', 'Comuna', 'RBD', 'Nombre Establecimiento',
+                          'RUN', 'Letra', 'Grado'])
+        wb.active.append([2026, 'PUDAHUEL', 1111, 'ESCUELA B', '12.345.678', 'C', '1° medio'])
+        wb.active.append([2026, 'PUDAHUEL', 1111, 'ESCUELA B', 19560438, None, '1° medio'])
+        wb.active.append([2025, 'PUDAHUEL', 1111, 'ESCUELA B', 12345678, 'A', '8° básico'])
+        wb.active.append([2025, 'PUDAHUEL', 1111, 'ESCUELA B', '22.218.556-4', 'A', '8° básico'])
+        wb.active.append([2025, 'PUDAHUEL', 1111, 'ESCUELA B', '19.560.438-1', 'A', '8° básico'])
+        wb.save(os.path.join(directorio, 'b_pudahuel.xlsx'))
+        
+        # Curso del año en curso antes que el de prematrícula, y solo el del año en curso
+        wb = Workbook()
+        wb.active.append(['ANO_ESCOLAR', 'NOM_COM_RBD', 'RBD_PRE', 'NOM_RBD', 'SAL_RUN',
+                          'LET_CUR', 'LET_CUR_PRE', 'COD_GRADO_GLOSA', 'COD_GRADO_GLOSA_PRE'])
+        wb.active.append([2026, 'CERRILLOS', 2222, 'ESCUELA C', 17000000, 'Z', 'D', '6° básico', '7° básico'])
+        hoja = wb.create_sheet('Solo actual')
+        hoja.append(['ANO_ESCOLAR', 'NOM_COM_RBD', 'RBD_PRE', 'NOM_RBD', 'SAL_RUN',
+                     'LET_CUR', 'COD_GRADO_GLOSA'])
+        hoja.append([2026, 'CERRILLOS', 2222, 'ESCUELA C', 17000001, 'Z', '6° básico'])
+        wb.save(os.path.join(directorio, 'c_cerrillos.xlsx'))
+        
+        # Un archivo dañado no detiene la ingesta
+        with open(os.path.join(directorio, 'd_dañado.xlsx'), 'wb') as f:
+            f.write(b'no es un excel')
+        
+        print("\n1. Normalizando columnas:")
+        for nombre in ['Año Escolar', 'Nombre Establecimiento', 'RUN']:
+            print(f"   {nombre} → {normalizar_columna(nombre)}")
+        assert normalizar_columna('Año Escolar') == 'ANO_ESCOLAR'
+        
+        print("\n2. Ingiriendo directorio:")
+        df, reportes = ingerir(directorio, max_procesos=2)
+        for r in reportes:
+            print(f"   {os.path.basename(r['archivo'])} / {r['hoja']}: {r['filas']} filas"
+                  f"{' (' + r['error'] + ')' if r['error'] else ''}")
+        
+        assert list(df.columns) == ['ANO_ESCOLAR', 'NOM_COM_RBD', 'RBD_PRE', 'NOM_RBD',
+                                    'SAL_RUN', 'LET_CUR_PRE', 'COD_GRADO_GLOSA_PRE']
+        assert len(df) == 6
+        fila = df[(df['SAL_RUN'] == 12345678) & (df['ANO_ESCOLAR'] == 2026)].iloc[0]
+        assert fila['NOM_RBD'] == 'ESCUELA A'
+        fila = df[df['SAL_RUN'] == 17000000].iloc[0]
+        assert (fila['COD_GRADO_GLOSA_PRE'], fila['LET_CUR_PRE']) == ('7° básico', 'D')
+        assert 17000001 not in set(df['SAL_RUN'])
+        assert reportes[-1]['duplicados'] == 1
+        assert reportes[-1]['segundos'] >= max(r['segundos'] for r in reportes[:-1])
+        assert any(r['error'] and 'COD_GRADO_GLOSA_PRE' in r['error'] for r in reportes)
+        assert any(r['error'] and r['archivo'].endswith('d_dañado.xlsx') for r in reportes)
+        
+        print("\n3. Datos compactos e índice por año:")
+        datos, _ = cargar_compacto(directorio, max_procesos=1)
+        df = datos.a_dataframe()
+        print(f"   ✓ Memoria: {df.memory_usage(deep=True).sum():,} bytes")
+        assert str(df['NOM_RBD'].dtype) == 'category'
+        assert datos.indices[2026] == {12345678: 0, 22218556: 1, 19560438: 2, 17000000: 3}
+        assert datos.indices[2025] == {12345678: 0, 22218556: 1}
+    finally:
+        shutil.rmtree(directorio)
+
+
+def test_prerender():
+    """Prueba la pre-generación de certificados por cohorte"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE PRE-GENERACIÓN")
+    print("="*80)
+    
+    directorio = tempfile.mkdtemp()
+    try:
+        df = pd.DataFrame({
+            'ANO_ESCOLAR': [2026, 2026, 2026],
+            'SAL_RUN': [12345678, 22218556, 19560438],
+            'RBD_PRE': [9877, 9877, 9877],
+            'NOM_RBD': ['ESCUELA GENERAL OHIGGINS'] * 3,
+            'NOM_COM_RBD': ['MAIPÚ'] * 3,
+            'COD_GRADO_GLOSA_PRE': ['1º Básico', '7° básico', '3° medio'],
+            'LET_CUR_PRE': ['A', 'B', 'C'],
+        })
+        registro = RegistroTemplates(os.path.join(directorio, 'templates'), 'template_certificado.docx')
+        almacen = AlmacenCertificados(os.path.join(directorio, 'almacen'))
+        fecha = datetime(2026, 3, 2)
+        
+        print("\n1. Generando cohortes 1° básico y 7° básico:")
+        resultado = prerenderizar(df, registro, almacen, fecha, ['1° básico', '7° básico'])
+        print(f"   ✓ Generados: {resultado['generados']}")
+        assert resultado['generados'] == 2
+        assert prerenderizar(df, registro, almacen, fecha, ['1° básico', '7° básico'])['existentes'] == 2
+        
+        print("\n2. Completando el nombre:")
+        datos = {fila['SAL_RUN']: GeneradorCertificado.preparar_datos_estudiante(fila)
+                 for _, fila in df.iterrows()}
+        clave = almacen.clave(22218556, 'template_certificado.docx', fecha, datos[22218556])
+        buffer = GeneradorCertificado.completar_nombre(almacen.obtener(clave), 'Ana Pérez')
+        texto = '\n'.join(p.text for p in Document(buffer).paragraphs)
+        print(f"   ✓ {'Don(a) ANA PÉREZ' in texto}")
+        assert 'Don(a) ANA PÉREZ, RUN 22.218.556-' in texto
+        assert '2 de marzo del 2026' in texto
+        assert almacen.obtener(almacen.clave(19560438, 'template_certificado.docx', fecha, datos[19560438])) is None
+        
+        # Si el estudiante cambia de curso, el certificado guardado ya no se usa
+        cambiado = dict(datos[22218556], curso='7° básico C')
+        assert almacen.obtener(almacen.clave(22218556, 'template_certificado.docx', fecha, cambiado)) is None
+        
+        print("\n3. Tamaño máximo del almacén:")
+        pequeño = AlmacenCertificados(os.path.join(directorio, 'pequeño'), max_mb=0.1)
+        prerenderizar(df, registro, pequeño, fecha, ['1° básico', '7° básico', '3° medio'])
+        print(f"   ✓ Certificados en almacén: {len(pequeño)}")
+        assert len(pequeño) == 1
+        assert len(os.listdir(os.path.join(directorio, 'pequeño'))) == 1
+    finally:
+        shutil.rmtree(directorio)
+
+
+def test_perfilador():
+    """Prueba el perfilador de solicitudes lentas"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE PERFILADOR")
+    print("="*80)
+    
+    directorio = tempfile.mkdtemp()
+    try:
+        perfilador = Perfilador(directorio, umbral_ms=20, max_perfiles=2, intervalo_ms=1)
+        
+        def solicitud(run, espera):
+            time.sleep(espera)
+            return run
+        
+        print("\n1. Perfilando solicitudes:")
+        for espera in (0.0, 0.03, 0.05, 0.04):
+            assert perfilador.perfilar('buscar_estudiante', solicitud, ('12.345.678-5', espera), {}) == '12.345.678-5'
+        
+        perfiles = sorted(f for f in os.listdir(directorio) if f.endswith('.json'))
+        print(f"   ✓ Perfiles guardados: {len(perfiles)}")
+        assert len(perfiles) == 2
+        
+        duraciones = []
+        for nombre in perfiles:
+            with open(os.path.join(directorio, nombre), encoding='utf-8') as f:
+                metadatos = json.load(f)
+            duraciones.append(metadatos['duracion_ms'])
+            assert metadatos['args'][0].startswith('run:')
+            # Sin la clave, el hash no coincide con un SHA-256 simple del RUN
+            assert hashlib.sha256(b'123456785').hexdigest()[:10] not in metadatos['args'][0]
+            with open(os.path.join(directorio, nombre.replace('.json', '.collapsed.txt')), encoding='utf-8') as f:
+                lineas = f.read().splitlines()
+            assert lineas and all(l.rsplit(' ', 1)[1].isdigit() for l in lineas)
+        print(f"   ✓ Duraciones (ms): {sorted(duraciones)}")
+        assert min(duraciones) >= 40
+        
+        print("\n2. Template de una generación lenta:")
+        generador = GeneradorCertificado('template_certificado.docx')
+        metadatos = anonimizar(generador)
+        print(f"   ✓ {metadatos}")
+        assert metadatos['template_path'] == 'template_certificado.docx'
+    finally:
+        shutil.rmtree(directorio)
+
+
+def test_docx_determinista():
+    """Prueba que datos idénticos produzcan bytes idénticos"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE DOCX DETERMINISTA")
+    print("="*80)
+    
+    datos = {
+        'nombre': 'ANA PÉREZ', 'run': '22.218.556-3', 'establecimiento': 'ESCUELA GENERAL OHIGGINS',
+        'rbd': 9877, 'curso': '7° básico B', 'año': 2026
+    }
+    fecha = datetime(2026, 3, 2)
+    generador = GeneradorCertificado('template_certificado.docx', determinista=True)
+    
+    print("\n1. Generando dos veces el mismo certificado:")
+    primero = generador.generar_certificado(datos, fecha).getvalue()
+    time.sleep(2.1)  # La fecha de un ZIP tiene resolución de 2 segundos
+    segundo = generador.generar_certificado(datos, fecha).getvalue()
+    print(f"   ✓ ETag: {calcular_etag(primero)}")
+    assert primero == segundo
+    assert calcular_etag(primero) == calcular_etag(segundo)
+    
+    print("\n2. Pre-generado con nombre completado vs. generado directamente:")
+    pendiente = dict(datos, nombre=GeneradorCertificado.NOMBRE_PENDIENTE)
+    pregenerado = generador.generar_certificado(pendiente, fecha).getvalue()
+    completado = GeneradorCertificado.completar_nombre(pregenerado, 'Ana Pérez').getvalue()
+    print(f"   ✓ Iguales: {completado == primero}")
+    assert completado == primero
+    
+    # Nombres que coinciden con otros patrones (año, establecimiento)
+    for nombre in ('MARIA FERNANDA GONZALEZ LOPEZ DE LA FUENTE', 'José 2025'):
+        directo = generador.generar_certificado(dict(datos, nombre=nombre.upper()), fecha).getvalue()
+        completado = GeneradorCertificado.completar_nombre(pregenerado, nombre).getvalue()
+        texto = '\n'.join(p.text for p in Document(io.BytesIO(directo)).paragraphs)
+        print(f"   ✓ {nombre}: iguales {completado == directo}")
+        assert completado == directo
+        assert f"Don(a) {nombre.upper()}, RUN" in texto
+    
+    otro = generador.generar_certificado(dict(datos, nombre='LUIS SOTO'), fecha).getvalue()
+    assert calcular_etag(otro) != calcular_etag(primero)
+
+
+def test_prueba_carga():
+    """Prueba la prueba de carga con pocas sesiones simultáneas"""
+    print("\n" + "="*80)
+    print("PRUEBAS DE PRUEBA DE CARGA")
+    print("="*80)
+    
+    assert percentil([3, 1, 2, 4], 50) == 2
+    assert percentil([3, 1, 2, 4], 99) == 4
+    assert percentil([], 95) == 0.0
+    assert percentil(range(1, 21), 95) == 19
+    assert percentil(range(1, 101), 95) == 95
+    
+    print("\n1. Flujos completos con 1 y 3 sesiones:")
+    directorio_original = os.getcwd()
+    resultados = ejecutar_prueba([1, 3], flujos_por_sesion=2, estudiantes=300)
+    assert os.getcwd() == directorio_original
+    for r in resultados:
+        print(f"   ✓ {r['sesiones']} sesiones: {r['flujos_por_seg']} flujos/s, "
+              f"p95 {r['p95_ms']} ms, errores {r['errores']}")
+        assert r['errores'] == 0, r['detalle_errores']
+        assert r['flujos'] == r['sesiones'] * 2
+        assert r['p50_ms'] <= r['p95_ms'] <= r['p99_ms']
+        assert r['rss_mb'] > 0
+
+
 def main():
     """Ejecuta todas las pruebas"""
     print("\n")
@@ -144,6 +538,13 @@ def main():
     test_utils()
     test_busqueda()
     test_generacion_certificado()
+    test_registro_templates()
+    test_base_datos_por_anio()
+    test_ingesta()
+    test_prerender()
+    test_perfilador()
+    test_docx_determinista()
+    test_prueba_carga()
     
     print("\n" + "="*80)
     print("PRUEBAS COMPLETADAS")
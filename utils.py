@@ -3,6 +3,37 @@ Utilidades para el sistema de certificados de matrícula
 SLEP Santa Corina
 """
 
+# Tablas para el dígito verificador (módulo 11).
+# Los pesos 2,3,4,5,6,7 se repiten cada 6 dígitos (de derecha a izquierda),
+# por lo que el RUN se procesa en bloques de 3 dígitos alternando dos tablas:
+# _SUMA_PESOS_234[n] es la suma ponderada de n (000-999) con pesos 2,3,4 y
+# _SUMA_PESOS_567[n] con pesos 5,6,7.
+_SUMA_PESOS_234 = [
+    (n % 10) * 2 + (n // 10 % 10) * 3 + (n // 100) * 4 for n in range(1000)
+]
+_SUMA_PESOS_567 = [
+    (n % 10) * 5 + (n // 10 % 10) * 6 + (n // 100) * 7 for n in range(1000)
+]
+_DV_POR_RESTO = ['0', 'K', '9', '8', '7', '6', '5', '4', '3', '2', '1']
+
+# Mayor RUN definitivo (sin DV): tienen a lo más 8 dígitos. Los RUN
+# provisorios (desde 100.000.000) existen, pero son menos frecuentes.
+RUN_MAXIMO_DEFINITIVO = 99_999_999
+
+
+def _dv_entero(run_int):
+    """Dígito verificador de un RUN entero usando las tablas precalculadas"""
+    suma = 0
+    while run_int > 0:
+        suma += _SUMA_PESOS_234[run_int % 1000]
+        run_int //= 1000
+        if not run_int:
+            break
+        suma += _SUMA_PESOS_567[run_int % 1000]
+        run_int //= 1000
+    return _DV_POR_RESTO[suma % 11]
+
+
 def calcular_dv(run):
     """
     Calcula el dígito verificador de un RUN chileno
@@ -13,32 +44,15 @@ def calcular_dv(run):
     Returns:
         str: Dígito verificador (0-9 o K)
     """
+    if isinstance(run, int) and not isinstance(run, bool) and run >= 0:
+        return _dv_entero(run)
+    
     run_str = str(run).replace(".", "").replace("-", "")
     
     if not run_str.isdigit():
         return None
-        
-    run_int = int(run_str)
-    
-    multiplicador = 2
-    suma = 0
-    
-    while run_int > 0:
-        suma += (run_int % 10) * multiplicador
-        run_int //= 10
-        multiplicador += 1
-        if multiplicador > 7:
-            multiplicador = 2
     
-    resto = suma % 11
-    dv = 11 - resto
-    
-    if dv == 11:
-        return '0'
-    elif dv == 10:
-        return 'K'
-    else:
-        return str(dv)
+    return _dv_entero(int(run_str))
 
 
 def formatear_run(run, dv=None):
@@ -131,6 +145,64 @@ def validar_run(run_completo):
     return dv_ingresado.upper() == dv_calculado.upper()
 
 
+def interpretar_run(run):
+    """
+    Determina cómo interpretar un RUN ingresado usando el dígito verificador
+    
+    Un RUN ingresado solo con números puede traer o no el DV al final
+    (ej: "123456785" puede ser 12.345.678-5 o el RUN 123.456.785 sin DV).
+    Si el último dígito es un DV válido se prioriza esa interpretación;
+    si el ingreso trae guión o termina en K, el DV es explícito. Si el
+    ingreso completo tiene 9 o más dígitos solo puede ser un RUN provisorio:
+    con DV válido se consulta como alternativa (después de no encontrar la
+    interpretación con DV) y con DV inválido como interpretación principal.
+    
+    Args:
+        run (str o int): RUN ingresado (con o sin formato)
+        
+    Returns:
+        tuple: (principales, alternativas)
+            - principales (list): RUN sin DV (int) que deben consultarse
+              todos; si más de uno existe, el ingreso es ambiguo
+            - alternativas (list): RUN sin DV (int) a probar solo si
+              ninguno de los principales existe (DV mal digitado, etc.)
+    """
+    texto = str(run).strip()
+    run_limpio = limpiar_run(texto)
+    
+    if len(run_limpio) < 2:
+        return [], []
+    
+    cuerpo = run_limpio[:-1]
+    dv = run_limpio[-1].upper()
+    dv_explicito = '-' in texto or dv == 'K'
+    completo = int(run_limpio) if run_limpio.isdigit() else None
+    dv_valido = cuerpo.isdigit() and _dv_entero(int(cuerpo)) == dv
+    
+    principales = []
+    alternativas = []
+    
+    if dv_valido:
+        principales.append(int(cuerpo))
+        if completo is not None and not dv_explicito:
+            if completo > RUN_MAXIMO_DEFINITIVO:
+                alternativas.append(completo)
+            else:
+                principales.append(completo)
+    elif completo is not None and not dv_explicito:
+        principales.append(completo)
+        alternativas.append(int(cuerpo))
+    elif cuerpo.isdigit():
+        principales.append(int(cuerpo))
+    
+    # Formato antiguo: algunos ingresos traen un carácter extra al final
+    if not dv_explicito and len(run_limpio) > 8 and run_limpio[:-2].isdigit():
+        alternativas.append(int(run_limpio[:-2]))
+    
+    alternativas = [r for r in dict.fromkeys(alternativas) if r not in principales]
+    return principales, alternativas
+
+
 def formatear_fecha(fecha_str):
     """
     Formatea una fecha en formato legible para el certificado